@@ -39,12 +39,42 @@ Example:
 # <http://www.opensource.org/licenses/mit-license.php>
 
 import os
+import re
 import sys
 import time
+import zlib
+import Queue
+import random
+import socket
+import base64
+import urllib
+import httplib
+import calendar
+import inspect
 import urllib2
+import urlparse
 import datetime
+import threading
+import traceback
 import exceptions
+# time.strptime imports this lazily, which isn't safe in worker threads
+import _strptime
+import collections
+from hashlib import sha1
 import xml.dom.minidom
+import xml.parsers.expat
+from StringIO import StringIO
+from xml.sax.saxutils import escape
+
+try:
+    import fcntl
+except ImportError:
+    fcntl=None
+
+try:
+    import sqlite3
+except ImportError:
+    sqlite3=None
 
 try:
     False
@@ -54,14 +84,66 @@ except NameError:
 
 TIMEFMT="%Y-%m-%d %H:%M:%S"
 
+# Timestamps already parsed.  Responses repeat them a lot (every item
+# created in one go has the same one), so they're remembered until there
+# are TIME_CACHE_SIZE of them, and then forgotten all at once.
+TIME_CACHE_SIZE=10000
+_parsedTimes={}
+_TIME=re.compile(r'(\d{4})-(\d\d)-(\d\d) (\d\d):(\d\d):(\d\d)\Z')
+
+def _parseTime(timeString):
+    # Match the fixed format rather than using strptime, which is slow and
+    # takes a lock.  Anything unusual is left to strptime, so the same
+    # strings parse (or fail) as before.
+    try:
+        m=_TIME.match(timeString)
+        if m is None:
+            raise ValueError(timeString)
+        tt=tuple([int(x) for x in m.groups()]) + (0, 0, -1)
+        if not (1 <= tt[1] <= 12 and tt[3] <= 23 and tt[4] <= 59
+            and tt[5] <= 61) \
+            or not 1 <= tt[2] <= calendar.monthrange(tt[0], tt[1])[1]:
+            raise ValueError(timeString)
+    except ValueError:
+        tt=time.strptime(timeString, TIMEFMT)
+    return time.mktime(tt)
+
 def parseTime(timeString):
     """Parse a timestamp from a backpack response."""
-    return(time.mktime(time.strptime(timeString, TIMEFMT)))
+    rv=_parsedTimes.get(timeString)
+    if rv is None:
+        rv=_parseTime(timeString)
+        if len(_parsedTimes) >= TIME_CACHE_SIZE:
+            _parsedTimes.clear()
+        _parsedTimes[timeString]=rv
+    return rv
+
+def parseTimes(timeStrings):
+    """Parse a sequence of timestamps, returning a list."""
+    rv=[]
+    parsed={}
+    for s in timeStrings:
+        t=parsed.get(s)
+        if t is None:
+            t=parsed[s]=parseTime(s)
+        rv.append(t)
+    return rv
 
 def formatTime(t):
     """Format a timestamp for an API call"""
     return(time.strftime(TIMEFMT, time.localtime(t)))
 
+def formatTimes(times):
+    """Format a sequence of timestamps, returning a list."""
+    rv=[]
+    formatted={}
+    for t in times:
+        s=formatted.get(t)
+        if s is None:
+            s=formatted[t]=formatTime(t)
+        rv.append(s)
+    return rv
+
 def getRelativeTime(rel, t=None):
     """Get the time relative to the specified time (default to now).
 
@@ -121,6 +203,20 @@ def getRelativeTime(rel, t=None):
 
     return rv
 
+def getRelativeTimes(rels, t=None):
+    """Get getRelativeTime() for each of a sequence of relative terms, all
+    relative to the same time (default to now)."""
+    if t is None:
+        t=time.time()
+    computed={}
+    rv=[]
+    for rel in rels:
+        r=computed.get(rel)
+        if r is None:
+            r=computed[rel]=getRelativeTime(rel, t)
+        rv.append(r)
+    return rv
+
 
 class BackpackError(exceptions.Exception):
     """Root exception thrown when a backpack error occurs."""
@@ -139,12 +235,1500 @@ class PageLimitExceeded(BackpackError):
     def __init__(self, msg):
         BackpackError.__init__(self, 403, msg)
 
+class RateLimited(BackpackError):
+    """Exception thrown when a non-blocking RateLimiter has no tokens left."""
+
+    def __init__(self):
+        BackpackError.__init__(self, 429, "Client rate limit exceeded")
+
+class CircuitOpen(BackpackError):
+    """Exception thrown when calls to a host are refused because it's been
+    failing."""
+
+    def __init__(self, host):
+        BackpackError.__init__(self, 503, "Too many failures talking to "
+            + host)
+
+class _Decompressor(object):
+    """Decompresses a gzip or deflate encoded response as it's read.
+
+    read(amt) reads amt compressed bytes, so it may return more or less
+    than amt; it only returns an empty string at the end."""
+
+    def __init__(self, fp, encoding):
+        self.fp=fp
+        self.encoding=encoding
+        if encoding == 'gzip':
+            self.obj=zlib.decompressobj(16 + zlib.MAX_WBITS)
+        else:
+            self.obj=zlib.decompressobj()
+        self.started=False
+        self.done=False
+
+    def __decode(self, data, final):
+        try:
+            rv=self.obj.decompress(data)
+        except zlib.error:
+            # Some servers send raw deflate data without the zlib header
+            if self.started or self.encoding != 'deflate':
+                raise
+            self.obj=zlib.decompressobj(-zlib.MAX_WBITS)
+            rv=self.obj.decompress(data)
+        self.started=True
+        if final:
+            rv += self.obj.flush()
+            self.done=True
+        return rv
+
+    def read(self, amt=None):
+        if self.done:
+            return ''
+        if amt is None:
+            return self.__decode(self.fp.read(), True)
+        rv=''
+        while not rv and not self.done:
+            data=self.fp.read(amt)
+            rv=self.__decode(data, not data)
+        return rv
+
+def compress(data):
+    """gzip a request body."""
+    c=zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return c.compress(data) + c.flush()
+
+class PooledResponse(object):
+    """A response handed out by a ConnectionPool.
+
+    This looks enough like the object urllib2 returns from open() that
+    callers can't tell the difference.  Closing it gives the connection
+    back to the pool if the body was completely consumed, otherwise the
+    connection is thrown away.
+
+    gzip and deflate encoded bodies are decompressed as they're read."""
+
+    def __init__(self, pool, key, conn, response, url):
+        self.pool=pool
+        self.key=key
+        self.conn=conn
+        self.response=response
+        self.url=url
+        self.code=response.status
+        self.msg=response.reason
+        self.headers=response.msg
+        self.encoding=response.getheader('content-encoding', '').lower()
+        if self.encoding in ('gzip', 'deflate'):
+            self.fp=_Decompressor(response, self.encoding)
+        else:
+            self.fp=response
+
+    def info(self):
+        return self.headers
+
+    def getcode(self):
+        return self.code
+
+    def geturl(self):
+        return self.url
+
+    def read(self, amt=None):
+        return self.fp.read(amt)
+
+    def close(self):
+        if self.conn is None:
+            return
+        reusable=self.response.isclosed() and not self.response.will_close
+        if not reusable:
+            self.response.close()
+        self.pool._checkin(self.key, self.conn, reusable)
+        self.conn=None
+
+class ConnectionPool(object):
+    """A pool of keep-alive HTTP connections.
+
+    One pool is normally shared by all of the APIs a Backpack instance
+    builds so they reuse each other's connections.
+
+    * size - maximum number of idle connections kept open
+    * maxPerHost - maximum number of connections to one host in use at once;
+      callers block until one is available
+    * idleTimeout - seconds an idle connection may sit before it's discarded
+    * timeout - socket timeout for new connections
+    * compressResponses - ask for gzip or deflate encoded responses
+    * compressRequests - gzip request bodies of at least this many bytes,
+      None to never compress them (the server has to support it)
+    * proxies - proxy URLs by scheme, e.g. {'http': 'http://proxy:3128'};
+      by default they come from the environment, as with urllib2.  http
+      requests go through the proxy and https ones are tunnelled.
+    """
+
+    def __init__(self, size=10, maxPerHost=4, idleTimeout=30, timeout=None,
+        compressResponses=True, compressRequests=None, proxies=None):
+        self.size=size
+        self.maxPerHost=maxPerHost
+        self.idleTimeout=idleTimeout
+        self.timeout=timeout
+        self.compressResponses=compressResponses
+        self.compressRequests=compressRequests
+        if proxies is None:
+            proxies=urllib.getproxies()
+        self.proxies=proxies
+        # (scheme, host, port) -> list of (lastUsed, connection)
+        self.idle={}
+        # (scheme, host, port) -> connections currently checked out
+        self.active={}
+        self.created=0
+        self.reused=0
+        self.cond=threading.Condition()
+
+    def _split(self, url):
+        """Split a URL into a pool key and the request path."""
+        scheme, netloc, path, query, fragment=urlparse.urlsplit(url)
+        if scheme not in ('http', 'https'):
+            raise ValueError("Unsupported URL:  " + url)
+        host=netloc
+        port=None
+        if ':' in netloc:
+            host, port=netloc.rsplit(':', 1)
+            port=int(port)
+        if port is None:
+            port={'http': 80, 'https': 443}[scheme]
+        if query:
+            path=path + '?' + query
+        return (scheme, host, port), path or '/'
+
+    def _proxy(self, key):
+        """Get (host, port, Proxy-Authorization value or None) of the proxy
+        for a pool key, or None to connect directly."""
+        scheme, host, port=key
+        proxy=self.proxies.get(scheme)
+        if not proxy or urllib.proxy_bypass(host):
+            return None
+        if '://' not in proxy:
+            proxy='http://' + proxy
+        netloc=urlparse.urlsplit(proxy)[1]
+        auth=None
+        if '@' in netloc:
+            userinfo, netloc=netloc.rsplit('@', 1)
+            auth='Basic ' + base64.b64encode(urllib.unquote(userinfo))
+        proxyHost, proxyPort=netloc, 8080
+        if ':' in netloc:
+            proxyHost, proxyPort=netloc.rsplit(':', 1)
+            proxyPort=int(proxyPort)
+        return proxyHost, proxyPort, auth
+
+    def _connect(self, key):
+        scheme, host, port=key
+        timeout=self.timeout
+        if timeout is None:
+            timeout=socket._GLOBAL_DEFAULT_TIMEOUT
+        proxy=self._proxy(key)
+        if proxy is not None:
+            proxyHost, proxyPort, auth=proxy
+            if scheme == 'https':
+                conn=httplib.HTTPSConnection(proxyHost, proxyPort,
+                    timeout=timeout)
+                tunnelHeaders=None
+                if auth is not None:
+                    tunnelHeaders={'Proxy-Authorization': auth}
+                conn.set_tunnel(host, port, tunnelHeaders)
+            else:
+                conn=httplib.HTTPConnection(proxyHost, proxyPort,
+                    timeout=timeout)
+        elif scheme == 'https':
+            conn=httplib.HTTPSConnection(host, port, timeout=timeout)
+        else:
+            conn=httplib.HTTPConnection(host, port, timeout=timeout)
+        self.cond.acquire()
+        try:
+            self.created += 1
+        finally:
+            self.cond.release()
+        return conn
+
+    def _checkout(self, key):
+        """Get (connection, wasIdle) for the given key, blocking while the
+        host is at its limit."""
+        rv=None
+        discard=[]
+        self.cond.acquire()
+        try:
+            while self.active.get(key, 0) >= self.maxPerHost:
+                self.cond.wait()
+            self.active[key]=self.active.get(key, 0) + 1
+            idle=self.idle.get(key, [])
+            oldest=time.time() - self.idleTimeout
+            while idle and rv is None:
+                lastUsed, conn=idle.pop()
+                if lastUsed < oldest:
+                    discard.append(conn)
+                else:
+                    rv=conn
+                    self.reused += 1
+        finally:
+            self.cond.release()
+        for conn in discard:
+            conn.close()
+        if rv is None:
+            return self._connect(key), False
+        return rv, True
+
+    # Connect a new connection, returning how long it took
+    def __open(self, conn):
+        start=time.time()
+        conn.connect()
+        return time.time() - start
+
+    def _checkin(self, key, conn, reusable):
+        discard=[]
+        self.cond.acquire()
+        try:
+            self.active[key] -= 1
+            if reusable:
+                self.idle.setdefault(key, []).append((time.time(), conn))
+                discard=self.__trim()
+            else:
+                discard=[conn]
+            self.cond.notifyAll()
+        finally:
+            self.cond.release()
+        for c in discard:
+            c.close()
+
+    # Drop the least recently used idle connections beyond the pool size.
+    # Must be called with the lock held.
+    def __trim(self):
+        everything=[]
+        for key, idle in self.idle.items():
+            for lastUsed, conn in idle:
+                everything.append((lastUsed, key, conn))
+        everything.sort()
+        rv=[]
+        for lastUsed, key, conn in everything[:max(0,
+                len(everything) - self.size)]:
+            self.idle[key].remove((lastUsed, conn))
+            rv.append(conn)
+        return rv
+
+    def urlopen(self, url, data=None, headers={}):
+        """Perform a request, returning a PooledResponse.
+
+        HTTP errors are raised as urllib2.HTTPError and connection failures
+        as urllib2.URLError, as urllib2 itself would."""
+        key, path=self._split(url)
+        method='GET'
+        if data is not None:
+            method='POST'
+        headers=dict(headers)
+        proxy=self._proxy(key)
+        if proxy is not None and key[0] == 'http':
+            # Plain http goes to the proxy with the whole URL
+            path=url
+            if proxy[2] is not None:
+                headers['Proxy-Authorization']=proxy[2]
+        if self.compressResponses:
+            headers['Accept-Encoding']='gzip, deflate'
+        if data and self.compressRequests is not None \
+            and len(data) >= self.compressRequests:
+            data=compress(data)
+            headers['Content-Encoding']='gzip'
+        conn, wasIdle=self._checkout(key)
+        connectTime=0
+        try:
+            try:
+                if not wasIdle:
+                    connectTime=self.__open(conn)
+                sent=time.time()
+                conn.request(method, path, data, headers)
+                response=conn.getresponse()
+            except (socket.error, httplib.HTTPException), e:
+                conn.close()
+                if not wasIdle:
+                    raise
+                # The server probably closed the idle connection; this is
+                # safe to try once more on a fresh one.
+                conn=self._connect(key)
+                connectTime=self.__open(conn)
+                sent=time.time()
+                conn.request(method, path, data, headers)
+                response=conn.getresponse()
+        except socket.error, e:
+            self._checkin(key, conn, False)
+            raise urllib2.URLError(e)
+        except:
+            self._checkin(key, conn, False)
+            raise
+
+        rv=PooledResponse(self, key, conn, response, url)
+        rv.connectTime=connectTime
+        rv.waitTime=time.time() - sent
+        if response.status >= 400:
+            body=rv.read()
+            rv.close()
+            raise urllib2.HTTPError(url, response.status, response.reason,
+                response.msg, StringIO(body))
+        return rv
+
+    def close(self):
+        """Close all idle connections."""
+        self.cond.acquire()
+        try:
+            idle=self.idle
+            self.idle={}
+        finally:
+            self.cond.release()
+        for conns in idle.values():
+            for lastUsed, conn in conns:
+                conn.close()
+
+class Future(object):
+    """The eventual result of a call handed to an Executor."""
+
+    def __init__(self):
+        self.value=None
+        # sys.exc_info() of the failure, if the call failed
+        self.excInfo=None
+        self.__done=threading.Event()
+        self.__lock=threading.Lock()
+        self.__callbacks=[]
+
+    def _set(self, value=None, excInfo=None):
+        self.value=value
+        self.excInfo=excInfo
+        self.__lock.acquire()
+        try:
+            self.__done.set()
+            callbacks=self.__callbacks
+            self.__callbacks=[]
+        finally:
+            self.__lock.release()
+        for cb in callbacks:
+            cb(self)
+
+    def addCallback(self, cb):
+        """Call cb with this Future when it completes (immediately if it
+        already has)."""
+        self.__lock.acquire()
+        try:
+            if not self.__done.isSet():
+                self.__callbacks.append(cb)
+                return
+        finally:
+            self.__lock.release()
+        cb(self)
+
+    def done(self):
+        """True if the call has completed."""
+        return self.__done.isSet()
+
+    def wait(self, timeout=None):
+        """Wait for the call to complete, returning done()."""
+        self.__done.wait(timeout)
+        return self.done()
+
+    def exception(self, timeout=None):
+        """Get the exception the call raised, or None."""
+        self.wait(timeout)
+        if self.excInfo is not None:
+            return self.excInfo[1]
+
+    def result(self, timeout=None):
+        """Get the result of the call, raising its exception if it failed."""
+        if not self.wait(timeout):
+            raise RuntimeError("Timed out waiting for result")
+        if self.excInfo is not None:
+            raise self.excInfo[0], self.excInfo[1], self.excInfo[2]
+        return self.value
+
+class Executor(object):
+    """A fixed set of worker threads running calls off a queue."""
+
+    def __init__(self, workers=4):
+        self.workers=workers
+        self.queue=Queue.Queue()
+        self.threads=[]
+        self.lock=threading.Lock()
+        self.local=threading.local()
+
+    def __start(self):
+        self.lock.acquire()
+        try:
+            while len(self.threads) < self.workers:
+                t=threading.Thread(target=self.__run,
+                    name="backpack-worker-%d" % (len(self.threads),))
+                t.setDaemon(True)
+                t.start()
+                self.threads.append(t)
+        finally:
+            self.lock.release()
+
+    def __run(self):
+        self.local.worker=True
+        while True:
+            job=self.queue.get()
+            if job is None:
+                break
+            f, fn, args, kwargs=job
+            try:
+                rv=fn(*args, **kwargs)
+            except:
+                f._set(excInfo=sys.exc_info())
+            else:
+                f._set(rv)
+
+    def isWorker(self):
+        """True if the current thread is one of this executor's workers."""
+        return getattr(self.local, 'worker', False)
+
+    def grow(self, workers):
+        """Make sure there are at least the given number of workers."""
+        self.lock.acquire()
+        try:
+            self.workers=max(self.workers, workers)
+        finally:
+            self.lock.release()
+
+    def submit(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) on a worker, returning a Future."""
+        if len(self.threads) < self.workers:
+            self.__start()
+        rv=Future()
+        self.queue.put((rv, fn, args, kwargs))
+        return rv
+
+    def shutdown(self):
+        """Stop the worker threads once the queued work is done."""
+        self.lock.acquire()
+        try:
+            threads=self.threads
+            self.threads=[]
+        finally:
+            self.lock.release()
+        for t in threads:
+            self.queue.put(None)
+        for t in threads:
+            t.join()
+
+def _runCalls(calls):
+    """Run calls one at a time, returning a completed Future per call."""
+    rv=[]
+    for call in calls:
+        f=Future()
+        try:
+            f._set(call[0](*call[1:]))
+        except:
+            f._set(excInfo=sys.exc_info())
+        rv.append(f)
+    return rv
+
+class CallInfo(object):
+    """Details of a single API call, given to hooks when it completes.
+
+    * path - the request path
+    * endpoint - the path with ids replaced by %d
+    * bytesSent, bytesReceived - request and response body sizes
+    * connect - seconds spent connecting, 0 for a reused connection and
+      None if unknown
+    * wait - seconds between sending the request and getting the response
+    * read - seconds reading the response body
+    * parse - seconds parsing the response
+    * total - seconds for the whole call
+    * status - HTTP status, if known
+    * error - the exception raised by the call, if any
+    * cached - True if the response came from the cache
+    * attempt - 1 for the first try of a call, 2 for its first retry, etc.
+    * throttle - seconds spent waiting for the RateLimiter
+    """
+
+    __slots__=('path', 'endpoint', 'bytesSent', 'bytesReceived', 'connect',
+        'wait', 'read', 'parse', 'total', 'status', 'error', 'cached',
+        'attempt', 'throttle')
+
+    def __init__(self, path, attempt=1):
+        self.path=path
+        self.endpoint=re.sub(r'\d+', '%d', path)
+        self.bytesSent=0
+        self.bytesReceived=0
+        self.connect=None
+        self.wait=0
+        self.read=0
+        self.parse=0
+        self.total=0
+        self.status=None
+        self.error=None
+        self.cached=False
+        self.attempt=attempt
+        self.throttle=0
+
+    def __repr__(self):
+        return "<CallInfo %s status=%s total=%.3fs error=%r>" \
+            % (self.path, self.status, self.total, self.error)
+
+class Histogram(object):
+    """A histogram of times over fixed, roughly exponential buckets."""
+
+    # Upper bounds of the buckets, in seconds
+    BOUNDS=[0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5,
+        10, 30, 60]
+
+    def __init__(self):
+        self.counts=[0] * (len(self.BOUNDS) + 1)
+        self.count=0
+        self.sum=0.0
+        self.max=0.0
+
+    def add(self, v):
+        i=0
+        while i < len(self.BOUNDS) and v > self.BOUNDS[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += v
+        self.max=max(self.max, v)
+
+    def percentile(self, p):
+        """Get the upper bound of the bucket holding the pth percentile."""
+        if self.count == 0:
+            return 0
+        want=self.count * p / 100.0
+        seen=0
+        for i in range(len(self.counts)):
+            seen += self.counts[i]
+            if seen >= want:
+                if i < len(self.BOUNDS):
+                    return min(self.BOUNDS[i], self.max)
+                return self.max
+        return self.max
+
+    def snapshot(self):
+        """Get the histogram as a dict."""
+        return {'count': self.count, 'sum': self.sum, 'max': self.max,
+            'bounds': self.BOUNDS + [None], 'counts': list(self.counts)}
+
+class Metrics(object):
+    """A hook that aggregates CallInfos into per-endpoint histograms.
+
+        metrics=backpack.Metrics()
+        bp.addHook(metrics)
+        ...
+        print metrics.report()
+    """
+
+    PHASES=['total', 'throttle', 'connect', 'wait', 'read', 'parse']
+
+    def __init__(self):
+        self.lock=threading.Lock()
+        # endpoint -> stats dict
+        self.endpoints={}
+
+    def __call__(self, info):
+        self.lock.acquire()
+        try:
+            stats=self.endpoints.get(info.endpoint)
+            if stats is None:
+                stats={'calls': 0, 'errors': 0, 'cached': 0, 'bytesSent': 0,
+                    'bytesReceived': 0, 'statuses': {}}
+                for phase in self.PHASES:
+                    stats[phase]=Histogram()
+                self.endpoints[info.endpoint]=stats
+            stats['calls'] += 1
+            if info.error is not None:
+                stats['errors'] += 1
+            if info.cached:
+                stats['cached'] += 1
+            stats['bytesSent'] += info.bytesSent
+            stats['bytesReceived'] += info.bytesReceived
+            status=info.status
+            if status is None and info.error is not None:
+                status=info.error.__class__.__name__
+            stats['statuses'][status]=stats['statuses'].get(status, 0) + 1
+            for phase in self.PHASES:
+                v=getattr(info, phase)
+                if v is not None:
+                    stats[phase].add(v)
+        finally:
+            self.lock.release()
+
+    def snapshot(self):
+        """Get all of the stats as plain dicts and lists."""
+        rv={}
+        self.lock.acquire()
+        try:
+            for endpoint, stats in self.endpoints.items():
+                d={}
+                for k, v in stats.items():
+                    if isinstance(v, Histogram):
+                        v=v.snapshot()
+                    elif isinstance(v, dict):
+                        v=dict(v)
+                    d[k]=v
+                rv[endpoint]=d
+        finally:
+            self.lock.release()
+        return rv
+
+    def report(self):
+        """Get a text report of the endpoints, most total time first."""
+        self.lock.acquire()
+        try:
+            rows=[(s['total'].sum, e, s) for e, s in self.endpoints.items()]
+        finally:
+            self.lock.release()
+        rows.sort()
+        rows.reverse()
+        out=["%-45s %6s %6s %9s %8s %8s %8s %8s" % ("endpoint", "calls",
+            "errors", "total(s)", "p50(ms)", "p99(ms)", "wait(s)",
+            "parse(s)")]
+        for total, endpoint, s in rows:
+            out.append("%-45s %6d %6d %9.3f %8.1f %8.1f %8.3f %8.3f" % (
+                endpoint, s['calls'], s['errors'], total,
+                s['total'].percentile(50) * 1000,
+                s['total'].percentile(99) * 1000,
+                s['wait'].sum, s['parse'].sum))
+        return '\n'.join(out)
+
+class CircuitBreaker(object):
+    """Tracks the failures of one host.
+
+    After failureThreshold failures in a row the circuit opens and calls
+    are refused for resetTimeout seconds.  Then a single trial call is let
+    through; if it works the circuit closes, otherwise it opens again."""
+
+    CLOSED='closed'
+    OPEN='open'
+    HALF_OPEN='half open'
+
+    def __init__(self, failureThreshold=5, resetTimeout=30):
+        self.failureThreshold=failureThreshold
+        self.resetTimeout=resetTimeout
+        self.state=self.CLOSED
+        self.failures=0
+        self.openedAt=0
+        self.lock=threading.Lock()
+
+    def allow(self):
+        """Check whether a call may be made now."""
+        self.lock.acquire()
+        try:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN \
+                and time.time() - self.openedAt >= self.resetTimeout:
+                self.state=self.HALF_OPEN
+                return True
+            return False
+        finally:
+            self.lock.release()
+
+    def success(self):
+        """Record a successful call."""
+        self.lock.acquire()
+        try:
+            self.state=self.CLOSED
+            self.failures=0
+        finally:
+            self.lock.release()
+
+    def release(self):
+        """Record a call that ended without an answer from the host, so
+        if it was the trial call the next one can be."""
+        self.lock.acquire()
+        try:
+            if self.state == self.HALF_OPEN:
+                self.state=self.OPEN
+        finally:
+            self.lock.release()
+
+    def failure(self):
+        """Record a failed call."""
+        self.lock.acquire()
+        try:
+            self.failures += 1
+            if self.state == self.HALF_OPEN \
+                or self.failures >= self.failureThreshold:
+                self.state=self.OPEN
+                self.openedAt=time.time()
+        finally:
+            self.lock.release()
+
+# Calls that would do something twice if repeated
+_NONIDEMPOTENT=re.compile(r'/(new|create|add|duplicate|email)$'
+    r'|/(toggle|move)/\d+$')
+
+class RetryPolicy(object):
+    """Decides which failed calls are retried, and when.
+
+    Transport errors, timeouts and 5xx responses are retried; errors
+    reported by Backpack itself and other HTTP errors are not.  Read-only
+    calls and updates are safe to repeat.  Calls that create something,
+    toggle or move are only retried with retryCreates.
+
+    * maxAttempts - tries per call, including the first
+    * backoff, maxBackoff - retry n waits a random time (full jitter) of up
+      to backoff * 2 ** (n - 1) seconds, but never more than maxBackoff
+    * budget - retries earned per request; each retry spends one, so 0.1
+      allows about one retry per ten requests, plus minRetries to start
+      with
+    * failureThreshold, resetTimeout - settings for the CircuitBreaker
+      kept for each host
+    """
+
+    def __init__(self, maxAttempts=3, backoff=0.1, maxBackoff=10,
+        retryCreates=False, budget=0.1, minRetries=10, failureThreshold=5,
+        resetTimeout=30):
+        self.maxAttempts=maxAttempts
+        self.backoff=backoff
+        self.maxBackoff=maxBackoff
+        self.retryCreates=retryCreates
+        self.budget=budget
+        self.minRetries=minRetries
+        self.failureThreshold=failureThreshold
+        self.resetTimeout=resetTimeout
+        self.tokens=float(minRetries)
+        self.retries=0
+        self.breakers={}
+        self.lock=threading.Lock()
+        self.sleep=time.sleep
+
+    def breaker(self, url):
+        """Get the CircuitBreaker for the host of a URL."""
+        host=urlparse.urlsplit(url)[1] or url
+        self.lock.acquire()
+        try:
+            rv=self.breakers.get(host)
+            if rv is None:
+                rv=CircuitBreaker(self.failureThreshold, self.resetTimeout)
+                self.breakers[host]=rv
+            return rv
+        finally:
+            self.lock.release()
+
+    def transient(self, e):
+        """Check whether an exception is a failure that may go away."""
+        if isinstance(e, urllib2.HTTPError):
+            return e.code >= 500
+        return isinstance(e, (urllib2.URLError, socket.error,
+            httplib.HTTPException))
+
+    def repeatable(self, path, safe):
+        """Check whether a call may be made again."""
+        return safe or self.retryCreates or not _NONIDEMPOTENT.search(path)
+
+    def delay(self, attempt):
+        """Get the seconds to wait before the given retry."""
+        return random.uniform(0, min(self.maxBackoff,
+            self.backoff * 2 ** (attempt - 1)))
+
+    def before(self, url):
+        """Called before each attempt; raises CircuitOpen if the host is
+        being avoided, and earns retry budget."""
+        if not self.breaker(url).allow():
+            raise CircuitOpen(urlparse.urlsplit(url)[1] or url)
+        self.lock.acquire()
+        try:
+            self.tokens=min(self.tokens + self.budget,
+                max(self.minRetries, 1))
+        finally:
+            self.lock.release()
+
+    def succeeded(self, url):
+        self.breaker(url).success()
+
+    def failed(self, url, path, safe, e, attempt):
+        """Record a failed attempt, returning True if it should be retried.
+
+        Errors the host answered with count as successes for its
+        CircuitBreaker; the host is up, the call was just wrong."""
+        if isinstance(e, CircuitOpen):
+            return False
+        breaker=self.breaker(url)
+        if not self.transient(e):
+            if isinstance(e, RateLimited) or not isinstance(e,
+                (BackpackError, urllib2.HTTPError)):
+                breaker.release()
+            else:
+                breaker.success()
+            return False
+        breaker.failure()
+        if attempt >= self.maxAttempts or not self.repeatable(path, safe) \
+            or breaker.state != CircuitBreaker.CLOSED:
+            return False
+        self.lock.acquire()
+        try:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            self.retries += 1
+        finally:
+            self.lock.release()
+        return True
+
+class RateLimiter(object):
+    """A token bucket limiting the rate of requests.
+
+    Tokens are added at rate per second, up to burst, and each request
+    takes one.  With blocking, a request waits for a token; otherwise it
+    fails with RateLimited.
+
+    Given a path, the bucket is kept in that file and shared by every
+    process using it (requires fcntl).  Otherwise it's shared by the
+    threads using this instance.
+
+    * acquired, rejected - requests let through and refused
+    * waited, maxWait - total and longest seconds spent waiting
+    """
+
+    def __init__(self, rate=10, burst=None, path=None, blocking=True):
+        if burst is None:
+            burst=rate
+        if path is not None and fcntl is None:
+            raise ValueError("Shared rate limits require fcntl")
+        self.rate=float(rate)
+        self.burst=float(burst)
+        self.path=path
+        self.blocking=blocking
+        self.tokens=self.burst
+        self.stamp=time.time()
+        self.acquired=0
+        self.rejected=0
+        self.waited=0
+        self.maxWait=0
+        self.lock=threading.Lock()
+        self.sleep=time.sleep
+
+    def __take(self, tokens, stamp, now):
+        tokens=min(self.burst, tokens + (now - stamp) * self.rate)
+        if tokens >= 1:
+            return tokens - 1, 0
+        return tokens, (1 - tokens) / self.rate
+
+    def __takeShared(self, now):
+        f=open(self.path, "a+")
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            f.seek(0)
+            try:
+                tokens, stamp=[float(x) for x in f.read().split()]
+            except ValueError:
+                tokens, stamp=self.burst, now
+            tokens, rv=self.__take(tokens, stamp, now)
+            f.seek(0)
+            f.truncate()
+            f.write("%r %r" % (tokens, now))
+            f.flush()
+            return rv
+        finally:
+            f.close()
+
+    def _take(self):
+        """Try to take a token, returning 0 or the seconds until one is
+        available."""
+        now=time.time()
+        self.lock.acquire()
+        try:
+            if self.path is not None:
+                return self.__takeShared(now)
+            self.tokens, rv=self.__take(self.tokens, self.stamp, now)
+            self.stamp=now
+            return rv
+        finally:
+            self.lock.release()
+
+    def acquire(self, blocking=None):
+        """Take a token, returning the seconds waited for it.
+
+        Raises RateLimited if there's none and this isn't blocking."""
+        if blocking is None:
+            blocking=self.blocking
+        waited=0
+        while True:
+            delay=self._take()
+            if delay == 0:
+                break
+            if not blocking:
+                self.lock.acquire()
+                self.rejected += 1
+                self.lock.release()
+                raise RateLimited()
+            self.sleep(delay)
+            waited += delay
+        self.lock.acquire()
+        try:
+            self.acquired += 1
+            self.waited += waited
+            self.maxWait=max(self.maxWait, waited)
+        finally:
+            self.lock.release()
+        return waited
+
+    def snapshot(self):
+        """Get the limiter's counters as a dict."""
+        self.lock.acquire()
+        try:
+            return {'acquired': self.acquired, 'rejected': self.rejected,
+                'waited': self.waited, 'maxWait': self.maxWait}
+        finally:
+            self.lock.release()
+
+# Paths that are about a single page
+_PAGE_PATH=re.compile(r'^/ws/page/(\d+)(/|$)')
+
+class ResponseCache(object):
+    """An in-memory LRU cache of responses to read-only API calls.
+
+    Responses are keyed by URL and request body, and any call that isn't
+    read-only drops the cached responses it may have changed:  everything
+    for the same page, plus the page list, search, tag and export results.
+
+    * maxEntries - the most responses kept
+    * ttl - default number of seconds a response stays fresh
+    * ttls - TTLs for specific endpoints, keyed by path with the ids
+      replaced by %d, e.g. {'/ws/page/%d/notes/list': 5}.  A TTL of zero
+      means the endpoint isn't cached.
+
+    Responses that came with an ETag or Last-Modified header are kept
+    after they expire, so the next call can revalidate them with a
+    conditional request (see conditions() and revalidate()).  Without
+    those headers an expired response is just a miss.
+    """
+
+    def __init__(self, maxEntries=256, ttl=30, ttls=None):
+        self.maxEntries=maxEntries
+        self.ttl=ttl
+        self.ttls={'/ws/account/export': 0}
+        if ttls is not None:
+            self.ttls.update(ttls)
+        self.hits=0
+        self.misses=0
+        self.revalidated=0
+        # (url, path, data) -> (expires, scope, body, validators)
+        self.entries=collections.OrderedDict()
+        self.lock=threading.Lock()
+
+    def endpoint(self, path):
+        """Get the endpoint template for a path."""
+        return re.sub(r'\d+', '%d', path)
+
+    def ttlFor(self, path):
+        """Get the TTL for a path."""
+        return self.ttls.get(self.endpoint(path), self.ttl)
+
+    def scope(self, url, path):
+        """Get the scope a path's response belongs to for invalidation."""
+        m=_PAGE_PATH.match(path)
+        if m:
+            return (url, 'page', int(m.group(1)))
+        return (url,) + tuple(path.split('/')[2:3])
+
+    def get(self, url, path, data):
+        """Get a fresh cached response body, or None."""
+        key=(url, path, data)
+        self.lock.acquire()
+        try:
+            entry=self.entries.get(key)
+            if entry is None or entry[0] < time.time():
+                self.misses += 1
+                return None
+            self.hits += 1
+            # Mark it most recently used
+            del self.entries[key]
+            self.entries[key]=entry
+            return entry[2]
+        finally:
+            self.lock.release()
+
+    def conditions(self, url, path, data):
+        """Get the headers for revalidating an expired response, or {}."""
+        self.lock.acquire()
+        try:
+            entry=self.entries.get((url, path, data))
+        finally:
+            self.lock.release()
+        if entry is None:
+            return {}
+        return conditionalHeaders(entry[3])
+
+    def revalidate(self, url, path, data):
+        """Mark an expired response fresh again after the server said it
+        hasn't changed, returning its body (or None if it's gone)."""
+        key=(url, path, data)
+        self.lock.acquire()
+        try:
+            entry=self.entries.pop(key, None)
+            if entry is None:
+                return None
+            self.revalidated += 1
+            self.entries[key]=(time.time() + self.ttlFor(path),) + entry[1:]
+            return entry[2]
+        finally:
+            self.lock.release()
+
+    def put(self, url, path, data, body, validators=None):
+        """Store a response body.
+
+        validators are the response's ETag and Last-Modified headers, keyed
+        by those names."""
+        ttl=self.ttlFor(path)
+        if ttl <= 0:
+            return
+        key=(url, path, data)
+        self.lock.acquire()
+        try:
+            if key in self.entries:
+                del self.entries[key]
+            self.entries[key]=(time.time() + ttl, self.scope(url, path), body,
+                validators or {})
+            while len(self.entries) > self.maxEntries:
+                self.entries.popitem(False)
+        finally:
+            self.lock.release()
+
+    def affected(self, url, path):
+        """Get the scopes a change made by the given call could affect."""
+        scope=self.scope(url, path)
+        if scope == (url, 'reminders'):
+            return [scope, (url, 'account')]
+        return [scope, (url, 'pages'), (url, 'tags'), (url, 'account')]
+
+    def invalidate(self, url, path):
+        """Drop responses that a change made by the given call could affect.
+        """
+        scopes=self.affected(url, path)
+        self.lock.acquire()
+        try:
+            for key, entry in self.entries.items():
+                if entry[1] in scopes:
+                    del self.entries[key]
+        finally:
+            self.lock.release()
+
+    def clear(self):
+        """Drop everything."""
+        self.lock.acquire()
+        try:
+            self.entries.clear()
+        finally:
+            self.lock.release()
+
+def validators(response):
+    """Get the ETag and Last-Modified headers of a response."""
+    rv={}
+    if hasattr(response, 'info'):
+        headers=response.info()
+        for h in ('ETag', 'Last-Modified'):
+            v=headers.getheader(h)
+            if v:
+                rv[h]=v
+    return rv
+
+def conditionalHeaders(validators):
+    """Get the request headers for revalidating a response with the given
+    ETag and Last-Modified validators."""
+    rv={}
+    if validators.get('ETag'):
+        rv['If-None-Match']=validators['ETag']
+    if validators.get('Last-Modified'):
+        rv['If-Modified-Since']=validators['Last-Modified']
+    return rv
+
+class DiskCache(ResponseCache):
+    """A ResponseCache kept in an SQLite database.
+
+    Any number of processes may share the file, so short-lived programs
+    (such as CGIs) can answer calls from responses fetched by earlier runs.
+
+    * path - the database file
+    * maxBytes - the most response data kept; the least recently used
+      responses are dropped beyond this
+    * ttl, ttls - as for ResponseCache
+    """
+
+    SCHEMA=["""create table if not exists responses (
+            key text primary key,
+            scope text,
+            expires real,
+            used real,
+            size integer,
+            etag text,
+            modified text,
+            body blob)""",
+        "create index if not exists responses_scope on responses(scope)",
+        "create index if not exists responses_used on responses(used)"]
+
+    def __init__(self, path, maxBytes=10*1024*1024, ttl=30, ttls=None):
+        if sqlite3 is None:
+            raise RuntimeError("DiskCache requires sqlite3")
+        ResponseCache.__init__(self, ttl=ttl, ttls=ttls)
+        self.path=path
+        self.maxBytes=maxBytes
+        self.db=sqlite3.connect(path, timeout=30, check_same_thread=False,
+            isolation_level=None)
+        self.db.text_factory=str
+        for sql in self.SCHEMA:
+            self.db.execute(sql)
+
+    def __key(self, url, path, data):
+        return sha1('\0'.join([url, path, data])).hexdigest()
+
+    def __encodeScope(self, scope):
+        return '\0'.join([str(s) for s in scope])
+
+    def __row(self, url, path, data):
+        return self.db.execute("select expires, etag, modified, body"
+            " from responses where key = ?",
+            (self.__key(url, path, data),)).fetchone()
+
+    def get(self, url, path, data):
+        now=time.time()
+        self.lock.acquire()
+        try:
+            row=self.__row(url, path, data)
+            if row is None or row[0] < now:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.db.execute("update responses set used = ? where key = ?",
+                (now, self.__key(url, path, data)))
+            return str(row[3])
+        finally:
+            self.lock.release()
+
+    def conditions(self, url, path, data):
+        self.lock.acquire()
+        try:
+            row=self.__row(url, path, data)
+        finally:
+            self.lock.release()
+        if row is None:
+            return {}
+        return conditionalHeaders({'ETag': row[1], 'Last-Modified': row[2]})
+
+    def revalidate(self, url, path, data):
+        now=time.time()
+        self.lock.acquire()
+        try:
+            row=self.__row(url, path, data)
+            if row is None:
+                return None
+            self.revalidated += 1
+            self.db.execute("update responses set expires = ?, used = ?"
+                " where key = ?", (now + self.ttlFor(path), now,
+                self.__key(url, path, data)))
+            return str(row[3])
+        finally:
+            self.lock.release()
+
+    def put(self, url, path, data, body, validators=None):
+        ttl=self.ttlFor(path)
+        if ttl <= 0 or len(body) > self.maxBytes:
+            return
+        validators=validators or {}
+        scope=self.__encodeScope(self.scope(url, path))
+        now=time.time()
+        self.lock.acquire()
+        try:
+            self.db.execute("insert or replace into responses"
+                " values (?, ?, ?, ?, ?, ?, ?, ?)",
+                (self.__key(url, path, data), scope, now + ttl, now,
+                len(body), validators.get('ETag'),
+                validators.get('Last-Modified'), sqlite3.Binary(body)))
+            self.__trim()
+        finally:
+            self.lock.release()
+
+    # Drop the least recently used responses beyond maxBytes.  Must be
+    # called with the lock held.
+    def __trim(self):
+        total=self.db.execute(
+            "select coalesce(sum(size), 0) from responses").fetchone()[0]
+        if total <= self.maxBytes:
+            return
+        drop=[]
+        for key, size in self.db.execute(
+            "select key, size from responses order by used"):
+            if total <= self.maxBytes:
+                break
+            drop.append((key,))
+            total -= size
+        self.db.executemany("delete from responses where key = ?", drop)
+
+    def invalidate(self, url, path):
+        scopes=self.affected(url, path)
+        self.lock.acquire()
+        try:
+            self.db.executemany("delete from responses where scope = ?",
+                [(self.__encodeScope(s),) for s in scopes])
+        finally:
+            self.lock.release()
+
+    def clear(self):
+        self.lock.acquire()
+        try:
+            self.db.execute("delete from responses")
+        finally:
+            self.lock.release()
+
+    def close(self):
+        """Close the database."""
+        self.db.close()
+
+def failures(futures):
+    """Get (index, exception) for each failed Future in a list."""
+    rv=[]
+    for i in range(len(futures)):
+        e=futures[i].exception()
+        if e is not None:
+            rv.append((i, e))
+    return rv
+
+# Elements the API parsers look at.  The expat parser doesn't keep anything
+# else around.
+ELEMENTS=['response', 'error', 'backpack', 'page', 'description', 'item',
+    'list', 'note', 'reminder', 'email', 'tags', 'tag', 'send']
+
+class _Element(object):
+    """A lightweight element built by _ExpatBuilder.
+
+    It supports the small part of the minidom API the parsers use:
+    getAttribute and getElementsByTagName.  Text is available via
+    nodeText()."""
+
+    __slots__=('tagName', 'attributes', 'text', 'children')
+
+    def __init__(self, tagName, attributes):
+        self.tagName=tagName
+        self.attributes=attributes
+        # A list of chunks while parsing, a single string after
+        self.text=[]
+        self.children=[]
+
+    def getAttribute(self, name):
+        return self.attributes.get(name, u'')
+
+    def getElementsByTagName(self, name):
+        rv=[]
+        stack=self.children[::-1]
+        while stack:
+            el=stack.pop()
+            if el.tagName == name:
+                rv.append(el)
+            stack.extend(el.children[::-1])
+        return rv
+
+class _ExpatBuilder(object):
+    """Incrementally builds _Elements out of a response using expat.
+
+    Only elements named in ``elements`` are kept, each attached to its
+    nearest kept ancestor.  If onEnd is given, it's called with each kept
+    element once it's complete.
+
+    If onEnd returns true, the element is dropped from its parent so a
+    streaming consumer doesn't accumulate the whole document."""
+
+    def __init__(self, elements=ELEMENTS, onEnd=None):
+        self.elements=dict([(e, 1) for e in elements])
+        self.onEnd=onEnd
+        self.document=_Element(u'#document', {})
+        # Every open element, with None for ones that aren't kept
+        self.__open=[]
+        # Open elements that are kept
+        self.__kept=[self.document]
+        self.parser=xml.parsers.expat.ParserCreate()
+        self.parser.buffer_text=True
+        self.parser.StartElementHandler=self.__start
+        self.parser.EndElementHandler=self.__end
+        self.parser.CharacterDataHandler=self.__data
+
+    def __start(self, name, attrs):
+        if name in self.elements:
+            el=_Element(name, attrs)
+            self.__kept[-1].children.append(el)
+            self.__kept.append(el)
+            self.__open.append(el)
+        else:
+            self.__open.append(None)
+
+    def __end(self, name):
+        el=self.__open.pop()
+        if el is not None:
+            self.__kept.pop()
+            el.text=u''.join(el.text)
+            if self.onEnd is not None and self.onEnd(el):
+                self.__kept[-1].children.pop()
+
+    def __data(self, data):
+        if self.__open and self.__open[-1] is not None:
+            self.__open[-1].text.append(data)
+
+    def feed(self, data, final=False):
+        """Feed some more of the document to the parser."""
+        self.parser.Parse(data, final)
+
+    def parse(self, source, chunkSize=16384):
+        """Parse a string or a file-like object, returning the document."""
+        if hasattr(source, 'read'):
+            data=source.read(chunkSize)
+            while data:
+                self.feed(data)
+                data=source.read(chunkSize)
+            self.feed('', True)
+        else:
+            self.feed(source, True)
+        return self.document
+
+class _Reader(object):
+    """Wraps a response, counting the bytes and time spent reading it and
+    optionally keeping a copy."""
+
+    def __init__(self, fp, keep=False):
+        self.fp=fp
+        self.count=0
+        self.elapsed=0
+        self.chunks=None
+        if keep:
+            self.chunks=[]
+
+    def read(self, amt=None):
+        start=time.time()
+        if amt is None:
+            rv=self.fp.read()
+        else:
+            rv=self.fp.read(amt)
+        self.elapsed += time.time() - start
+        self.count += len(rv)
+        if self.chunks is not None:
+            self.chunks.append(rv)
+        return rv
+
+    def getvalue(self):
+        return ''.join(self.chunks)
+
+class RequestTemplate(object):
+    """A request to an endpoint, with values filled in when it's rendered.
+
+    The path is a %-format taking the ids, and the body one taking
+    %(name)s strings.  The body is split up once, and body values are
+    encoded as UTF-8 and XML escaped when rendered:
+
+        t=RequestTemplate("/ws/page/%(pageId)d/notes/create",
+            "<note><title>%(title)s</title><body>%(body)s</body></note>")
+        path, data=t.render({'pageId': 1, 'title': u'A & B', 'body': ''})
+    """
+
+    FIELD=re.compile(r'%\((\w+)\)s')
+
+    def __init__(self, path, body=""):
+        self.path=path
+        # Alternating literal text and field names
+        self.parts=self.FIELD.split(body)
+
+    def render(self, values):
+        """Get the (path, data) for the given values."""
+        parts=self.parts[:]
+        for i in range(1, len(parts), 2):
+            v=values[parts[i]]
+            if isinstance(v, unicode):
+                v=v.encode("utf-8")
+            elif not isinstance(v, str):
+                v=str(v)
+            parts[i]=escape(v)
+        return self.path % values, ''.join(parts)
+
+def nodeText(node):
+    """Get the text content of an element from either parser."""
+    if isinstance(node, _Element):
+        return node.text
+    return node.firstChild.data
+
+# Templates for the requests that send data
+_REMINDER_CREATE=RequestTemplate("/ws/reminders/create",
+    "<reminder><content>%(content)s</content></reminder>")
+_REMINDER_CREATE_AT=RequestTemplate("/ws/reminders/create",
+    "<reminder><content>%(content)s</content>"
+    "<remind_at>%(at)s</remind_at></reminder>")
+_REMINDER_UPDATE=RequestTemplate("/ws/reminders/update/%(id)d",
+    "<reminder><content>%(content)s</content></reminder>")
+_REMINDER_UPDATE_AT=RequestTemplate("/ws/reminders/update/%(id)d",
+    "<reminder><content>%(content)s</content>"
+    "<remind_at>%(at)s</remind_at></reminder>")
+_PAGE_CREATE=RequestTemplate("/ws/pages/new",
+    "<page><title>%(title)s</title></page>")
+_PAGE_SEARCH=RequestTemplate("/ws/pages/search", "<term>%(term)s</term>")
+_PAGE_UPDATE_TITLE=RequestTemplate("/ws/page/%(id)d/update_title",
+    "<page><title>%(title)s</title></page>")
+_PAGE_SHARE=RequestTemplate("/ws/page/%(id)d/share",
+    "<page><public>%(isPublic)s</public></page>")
+_PAGE_SHARE_WITH=RequestTemplate("/ws/page/%(id)d/share",
+    "<email_addresses>%(emailAddresses)s</email_addresses>"
+    "<page><public>%(isPublic)s</public></page>")
+_LIST_CREATE=RequestTemplate("/ws/page/%(pageId)d/lists/add",
+    "<name>%(name)s</name>")
+_LIST_UPDATE=RequestTemplate("/ws/page/%(pageId)d/lists/update/%(listId)d",
+    "<list><name>%(name)s</name></list>")
+_ITEM_CREATE=RequestTemplate("/ws/page/%(pageId)d/lists/%(listId)d/items/add",
+    "<item><content>%(text)s</content></item>")
+_ITEM_UPDATE=RequestTemplate(
+    "/ws/page/%(pageId)d/lists/%(listId)d/items/update/%(id)d",
+    "<item><content>%(text)s</content></item>")
+_ITEM_MOVE=RequestTemplate(
+    "/ws/page/%(pageId)d/lists/%(listId)d/items/move/%(id)d",
+    "<direction>%(direction)s</direction>")
+_NOTE_CREATE=RequestTemplate("/ws/page/%(pageId)d/notes/create",
+    "<note><title>%(title)s</title><body>%(body)s</body></note>")
+_NOTE_UPDATE=RequestTemplate("/ws/page/%(pageId)d/notes/update/%(noteId)d",
+    "<note><title>%(title)s</title><body>%(body)s</body></note>")
+_TAG_PAGE=RequestTemplate("/ws/page/%(pageId)d/tags/tag",
+    "<tags>%(tags)s</tags>")
+
+# A change made through one of the APIs, given to listeners.  api is the
+# name of the Backpack attribute holding the API ('reminder', 'listItem',
+# ...), method the method called, and result what it returned.  args has
+# every named argument by position, however it was passed and including
+# defaults.
+Change=collections.namedtuple('Change', 'api method args result')
+
+def _notifies(api):
+    """Decorate an API method that changes the account so that listeners
+    are told about each successful call."""
+    def decorate(method):
+        names=inspect.getargspec(method).args[1:]
+        def notifying(self, *args, **kwargs):
+            rv=method(self, *args, **kwargs)
+            if self.listeners:
+                given=inspect.getcallargs(method, self, *args, **kwargs)
+                self._notify(Change(api, method.__name__,
+                    tuple([given[n] for n in names]), rv))
+            return rv
+        notifying.__name__=method.__name__
+        notifying.__doc__=method.__doc__
+        return notifying
+    return decorate
+
 class BackpackAPI(object):
     """Interface to the backpack API"""
 
     debug=False
     url=None
     key=None
+    # ConnectionPool used for requests, or None to use plain urllib2
+    pool=None
+    # Response parser, either 'expat' or 'minidom'
+    parser='expat'
+    # ResponseCache for read-only calls, if any
+    cache=None
+    # Callables given a CallInfo after every call
+    hooks=()
+    # Callables given a Change after every successful change
+    listeners=()
+    # The Backpack this API belongs to, if any
+    client=None
+    # RetryPolicy for failed calls, if any
+    retry=None
+    # RateLimiter for requests, if any
+    limiter=None
+    # Headers sent with every request
+    HEADERS={'Content-Type': 'application/xml'}
+    __prefix=None
+    __opener=None
 
     def __init__(self, u, k, debug=False):
         """Get a Backpack object to the given URL and key"""
@@ -156,69 +1740,257 @@ class BackpackAPI(object):
         self.debug=debug
 
     def _parseListItems(self, document):
-        """Parses list items from from a minidom document
+        """Parses list items from from a parsed document
 
         Returns a list of (id, completed boolean, item text)
         """
         rv=[]
         for item in document.getElementsByTagName("item"):
-            rv.append((int(item.getAttribute("id")),
+            rv.append(ListItem(int(item.getAttribute("id")),
                 item.getAttribute("completed") == "true",
-                unicode(item.firstChild.data)))
+                unicode(nodeText(item))))
         return rv
 
     def _parseLists(self, document):
         rv=[]
         for list in document.getElementsByTagName("list"):
-            rv.append( (int(list.getAttribute("id")),
-                unicode(list.getAttribute("name"))) )
+            rv.append(ListRef(int(list.getAttribute("id")),
+                unicode(list.getAttribute("name"))))
         return rv
 
     def _parseNotes(self, document):
         rv=[]
         for note in document.getElementsByTagName("note"):
             try:
-                childData = unicode(note.firstChild.data).strip()
+                childData = unicode(nodeText(note)).strip()
             except AttributeError:
                 childData = ''
-            rv.append( (int(note.getAttribute("id")),
+            rv.append(Note(int(note.getAttribute("id")),
                 unicode(note.getAttribute("title")),
                 parseTime(note.getAttribute("created_at")),
                 childData))
         return rv
 
+    # Build a document from a string or file-like object with the configured
+    # parser
+    def _buildDocument(self, source):
+        if self.parser == 'minidom':
+            if hasattr(source, 'read'):
+                return xml.dom.minidom.parse(source)
+            return xml.dom.minidom.parseString(source)
+        return _ExpatBuilder().parse(source)
+
+    # The start of every request body, built once per key
+    def _prefix(self):
+        rv=self.__prefix
+        if rv is None or rv[0] != self.key:
+            rv=(self.key, "<request><token>%s</token>" % (escape(self.key),))
+            self.__prefix=rv
+        return rv[1]
+
+    def _opener(self):
+        if BackpackAPI.__opener is None:
+            BackpackAPI.__opener=urllib2.build_opener()
+        return BackpackAPI.__opener
+
+    # Render a RequestTemplate and call it
+    def _request(self, template, safe=False, **values):
+        path, data=template.render(values)
+        return self._call(path, data, safe)
+
     # Parse a backpack document, throwing a BackpackError if the document
     # indicates an exception
     def _parseDocument(self, docString):
-        document=xml.dom.minidom.parseString(docString)
+        document=self._buildDocument(docString)
         # Check for error
         responseEl=document.getElementsByTagName("response")[0]
         if responseEl.getAttribute("success") != "true":
             er=responseEl.getElementsByTagName("error")[0]
             raise BackpackError(int(er.getAttribute("code")),
-                unicode(er.firstChild.data))
+                unicode(nodeText(er)))
         return document
 
-    # Perform the actual call
-    def _call(self, path, data=""):
-        p={'token':self.key, 'extra':data}
-        reqData="""<request><token>%(token)s</token>%(extra)s</request>""" % p
+    # Send a request, returning the open response
+    def _open(self, path, data="", headers=None):
+        reqData=self._prefix() + data + "</request>"
         theUrl=self.url + path
 
         if self.debug:
             print ">>(%s)\n%s" % (theUrl, reqData)
 
-        req=urllib2.Request(theUrl, reqData, {'Content-Type': 'application/xml'})
-        opener=urllib2.build_opener()
-
-        o=opener.open(req)
-        result=o.read()
-        o.close()
+        if headers:
+            headers=dict(self.HEADERS, **headers)
+        else:
+            headers=self.HEADERS
+        if self.pool is None:
+            req=urllib2.Request(theUrl, reqData, headers)
+            o=self._opener().open(req)
+        else:
+            o=self.pool.urlopen(theUrl, reqData, headers)
+        o.bytesSent=len(reqData)
+        return o
+
+    # Perform the actual call.  safe calls are read-only, and may be answered
+    # from the cache.
+    def _call(self, path, data="", safe=False):
+        cache=self.cache
+        if cache is not None and safe:
+            result=cache.get(self.url, path, data)
+            if result is not None:
+                return self.__cached(path, result)
+        rv, info=self._attempt(path, safe,
+            lambda info: self.__call(path, data, safe, info))
+        self._fire(info)
+        return rv
 
+    # Answer a call from the cache.  The server isn't asked, so neither the
+    # RetryPolicy nor the RateLimiter is involved.
+    def __cached(self, path, result):
         if self.debug:
-            print "<< %s" % (result,)
+            print "<< (cached) %s" % (result,)
+        info=CallInfo(path)
+        info.cached=True
+        info.bytesReceived=len(result)
+        start=time.time()
+        try:
+            return self.__parse(result, info)
+        except:
+            info.error=sys.exc_info()[1]
+            raise
+        finally:
+            info.total=time.time() - start
+            self._fire(info)
+
+    # Make a request to the server with request(info), which returns the
+    # result and fills in info.  It's paced by the RateLimiter and retried as
+    # the RetryPolicy allows; the CallInfo of each failed attempt is given to
+    # the hooks.  Returns the result and the CallInfo of the attempt that
+    # worked, for the caller to fire.
+    def _attempt(self, path, safe, request):
+        policy=self.retry
+        attempt=1
+        while True:
+            info=CallInfo(path, attempt)
+            start=time.time()
+            try:
+                if policy is not None:
+                    policy.before(self.url)
+                if self.limiter is not None:
+                    info.throttle=self.limiter.acquire()
+                rv=request(info)
+            except:
+                excInfo=sys.exc_info()
+                info.error=excInfo[1]
+                if isinstance(info.error, urllib2.HTTPError):
+                    info.status=info.error.code
+                info.total=time.time() - start
+                self._fire(info)
+                if policy is not None and policy.failed(self.url, path, safe,
+                    info.error, attempt):
+                    policy.sleep(policy.delay(attempt))
+                    attempt += 1
+                    continue
+                raise excInfo[0], excInfo[1], excInfo[2]
+            info.total=time.time() - start
+            if policy is not None:
+                policy.succeeded(self.url)
+            return rv, info
+
+    # Make one request to the server, revalidating a cached response if
+    # there is one.
+    def __call(self, path, data, safe, info):
+        cache=self.cache
+        conditions=None
+        if cache is not None and safe:
+            conditions=cache.conditions(self.url, path, data)
+
+        # The response is parsed as it's read; it's only kept whole when
+        # it's needed for the cache or debugging.
+        keep=self.debug or (cache is not None and safe)
+        try:
+            o=self._send(path, info, data, conditions)
+            if info.status == 304:
+                o.read()
+                o.close()
+                result=cache.revalidate(self.url, path, data)
+                if result is None:
+                    # It was dropped in the meantime; fetch it again
+                    if self.limiter is not None:
+                        info.throttle += self.limiter.acquire()
+                    return self.__call(path, data, safe, info)
+                info.cached=True
+                info.bytesReceived=len(result)
+                return self.__parse(result, info)
+            reader=_Reader(o, keep)
+            try:
+                rv=self.__parse(reader, info)
+            finally:
+                o.close()
+                info.read=reader.elapsed
+                info.parse -= reader.elapsed
+                info.bytesReceived=reader.count
+                if self.debug:
+                    print "<< %s" % (reader.getvalue(),)
+        finally:
+            if cache is not None and not safe:
+                cache.invalidate(self.url, path)
+
+        if cache is not None and safe:
+            cache.put(self.url, path, data, reader.getvalue(), validators(o))
+        return rv
 
-        return self._parseDocument(result)
+    # Open a request, noting what's known of it so far in info
+    def _send(self, path, info, data="", conditions=None):
+        start=time.time()
+        o=self.__open(path, data, conditions)
+        opened=time.time()
+        info.status=getattr(o, 'code', None)
+        info.bytesSent=getattr(o, 'bytesSent', 0)
+        info.connect=getattr(o, 'connectTime', None)
+        info.wait=getattr(o, 'waitTime', opened - start)
+        return o
+
+    # Open a request, conditionally if there are headers for it.  urllib2
+    # raises a 304 as an HTTPError, which is also a response.
+    def __open(self, path, data, conditions):
+        if not conditions:
+            return self._open(path, data)
+        try:
+            return self._open(path, data, conditions)
+        except urllib2.HTTPError, e:
+            if e.code != 304:
+                raise
+            return e
+
+    def __parse(self, result, info):
+        start=time.time()
+        try:
+            return self._parseDocument(result)
+        finally:
+            info.parse=time.time() - start
+
+    # Run calls concurrently through the client if there is one, otherwise
+    # one at a time.  Returns a completed Future per call.
+    def _batch(self, calls, maxInFlight=None):
+        if self.client is not None:
+            return self.client.batch(calls, maxInFlight)
+        return _runCalls(calls)
+
+    # Give a CallInfo to the hooks
+    def _fire(self, info):
+        for hook in self.hooks:
+            try:
+                hook(info)
+            except Exception:
+                traceback.print_exc()
+
+    # Give a Change to the listeners
+    def _notify(self, change):
+        for listener in self.listeners:
+            try:
+                listener(change)
+            except Exception:
+                traceback.print_exc()
 
 class ReminderAPI(BackpackAPI):
     """Backpack reminder API."""
@@ -234,61 +2006,296 @@ class ReminderAPI(BackpackAPI):
 
         reminders=document.getElementsByTagName("reminder")
         for r in reminders:
-            timestamp=parseTime(r.getAttribute("remind_at"))
-            id=int(r.getAttribute("id"))
-            message=unicode(r.firstChild.data)
-
-            rv.append((timestamp, id, message))
+            rv.append(self._parseReminder(r))
 
         return rv
 
+    # parse a single reminder element
+    def _parseReminder(self, r):
+        timestamp=parseTime(r.getAttribute("remind_at"))
+        id=int(r.getAttribute("id"))
+        message=unicode(nodeText(r))
+
+        return Reminder(timestamp, id, message)
+
     def list(self):
         """Get a list of upcoming reminders.
 
            Returns a list of (timestamp, id, message)"""
-        x=self._call("/ws/reminders")
+        x=self._call("/ws/reminders", safe=True)
 
         return self._parseReminders(x)
 
+    @_notifies('reminder')
     def create(self, content, at=None):
         """Create a reminder with the given content.
 
            If a time is not given, the content is expected to start with the
            +minute or +hour:minute format as specified by backpack."""
 
-        val=""
         if at is None:
             if content[0] != '+':
                 raise ValueError("No at, and content not beginning with +")
-            val="""<content>%s</content>""" % (content,)
+            x=self._request(_REMINDER_CREATE, content=content)
         else:
-            val="<content>%s</content><remind_at>%s</remind_at>" \
-                % (content, at)
-
-        x=self._call("/ws/reminders/create",
-            "<reminder>%s</reminder>" % (val,))
+            x=self._request(_REMINDER_CREATE_AT, content=content, at=at)
         return self._parseReminders(x)
 
+    @_notifies('reminder')
     def update(self, id, content, at=None):
         """Update the given reminder.
 
            If a time is not given, only the content will be updated."""
 
-        val=""
         if at is None:
-            val="""<content>%s</content>""" % (content,)
+            x=self._request(_REMINDER_UPDATE, id=id, content=content)
         else:
-            val="<content>%s</content><remind_at>%s</remind_at>" \
-                % (content, at)
-
-        x=self._call("/ws/reminders/update/%d" % (id, ),
-            "<reminder>%s</reminder>" % (val, ))
+            x=self._request(_REMINDER_UPDATE_AT, id=id, content=content,
+                at=at)
         return self._parseReminders(x)
 
+    @_notifies('reminder')
     def destroy(self, id):
         """Delete a reminder"""
         x=self._call("/ws/reminders/destroy/%d" % (id,))
 
+# Records returned by the APIs.  These are tuples, so they can still be
+# unpacked or compared as before, with named fields.
+ListItem=collections.namedtuple('ListItem', 'id completed text')
+ListRef=collections.namedtuple('ListRef', 'id name')
+Note=collections.namedtuple('Note', 'id title createdAt text')
+Reminder=collections.namedtuple('Reminder', 'remindAt id message')
+Email=collections.namedtuple('Email', 'id subject createdAt text')
+PageRef=collections.namedtuple('PageRef', 'id scope title')
+PageTitle=collections.namedtuple('PageTitle', 'id title')
+Tag=collections.namedtuple('Tag', 'id name')
+ExportedPage=collections.namedtuple('ExportedPage',
+    'id title emailAddress description items')
+
+class ScheduleResult(object):
+    """What a ReminderScheduler flush did.
+
+    * created - the new Reminders
+    * skippedCreates - (content, timestamp) of creates that duplicated an
+      existing reminder
+    * skippedUpdates - ids of updates that wouldn't change anything
+    * updated - ids of updated reminders
+    * destroyed - ids of destroyed reminders
+    * failed - list of (operation, exception) for operations that failed,
+      where operation is ('create', content, at), ('update', id, content,
+      at) or ('destroy', id)
+    """
+
+    def __init__(self):
+        self.created=[]
+        self.skippedCreates=[]
+        self.skippedUpdates=[]
+        self.updated=[]
+        self.destroyed=[]
+        self.failed=[]
+
+    def __repr__(self):
+        return "<ScheduleResult created=%d skipped=%d/%s updated=%s" \
+            " destroyed=%s failed=%d>" % (len(self.created),
+            len(self.skippedCreates), self.skippedUpdates, self.updated,
+            self.destroyed, len(self.failed))
+
+# +minutes or +hours:minutes at the start of a reminder
+_RELATIVE_REMINDER=re.compile(r'^\+(\d+)(?::(\d+))?\s*(.*)$', re.S)
+
+class ReminderScheduler(object):
+    """Queues reminder changes and makes only the ones that are needed.
+
+        s=backpack.ReminderScheduler(bp.reminder)
+        s.create("Disk full on db1", backpack.getRelativeTime("later"))
+        s.create("Disk full on  db1", ...)
+        print s.flush()
+
+    Creates are compared with each other and with the account's reminders
+    (from a list() that's reused for maxAge seconds).  Ones with the same
+    text, ignoring case and spacing, due within window seconds of each
+    other are duplicates and skipped.  Several updates to one reminder
+    become the last one, and a destroy replaces any updates.  flush() makes
+    the remaining changes concurrently.
+    """
+
+    def __init__(self, api, window=60, maxAge=60):
+        self.api=api
+        self.window=window
+        self.maxAge=maxAge
+        self.existing=None
+        self.fetched=0
+        self.lock=threading.Lock()
+        self.__reset()
+
+    def __reset(self):
+        self.creates=[]
+        # id -> (content, at)
+        self.updates=collections.OrderedDict()
+        self.destroys=collections.OrderedDict()
+
+    def normalize(self, content):
+        """Get the form of a reminder's text used to find duplicates."""
+        return u' '.join(content.split()).lower()
+
+    def __resolve(self, content, at):
+        # Get (content, timestamp), turning a +time prefix into a time
+        if at is None:
+            m=_RELATIVE_REMINDER.match(content)
+            if m is None:
+                raise ValueError("No at, and content not beginning with +")
+            minutes=int(m.group(1))
+            if m.group(2) is not None:
+                minutes=minutes * 60 + int(m.group(2))
+            return m.group(3), time.time() + minutes * 60
+        if isinstance(at, basestring):
+            return content, parseTime(at)
+        return content, at
+
+    def create(self, content, at=None):
+        """Queue a reminder to be created.
+
+        at is a timestamp or a formatted time; without it, content starts
+        with +minutes or +hours:minutes as for ReminderAPI.create()."""
+        self.lock.acquire()
+        try:
+            self.creates.append(self.__resolve(content, at))
+        finally:
+            self.lock.release()
+
+    def update(self, id, content, at=None):
+        """Queue a change to a reminder."""
+        if at is not None and not isinstance(at, basestring):
+            at=formatTime(at)
+        self.lock.acquire()
+        try:
+            if id not in self.destroys:
+                self.updates[id]=(content, at)
+        finally:
+            self.lock.release()
+
+    def destroy(self, id):
+        """Queue a reminder to be destroyed."""
+        self.lock.acquire()
+        try:
+            self.updates.pop(id, None)
+            self.destroys[id]=True
+        finally:
+            self.lock.release()
+
+    def pending(self):
+        """Get the number of queued operations."""
+        return len(self.creates) + len(self.updates) + len(self.destroys)
+
+    def reminders(self):
+        """Get the account's reminders, listing them if the last list is
+        older than maxAge."""
+        if self.existing is None or self.fetched + self.maxAge < time.time():
+            self.existing=self.api.list()
+            self.fetched=time.time()
+        return self.existing
+
+    def __duplicate(self, seen, content, t):
+        for other in seen.get(self.normalize(content), ()):
+            if abs(other - t) <= self.window:
+                return True
+        return False
+
+    def flush(self, maxInFlight=None):
+        """Make the queued changes, returning a ScheduleResult.
+
+        If the reminders can't be listed, the changes stay queued and the
+        error is raised."""
+        self.lock.acquire()
+        try:
+            creates, updates, destroys=self.creates, self.updates, \
+                self.destroys
+            self.__reset()
+        finally:
+            self.lock.release()
+
+        try:
+            existing=self.reminders()
+        except:
+            excInfo=sys.exc_info()
+            self.__restore(creates, updates, destroys)
+            raise excInfo[0], excInfo[1], excInfo[2]
+
+        rv=ScheduleResult()
+        byId=dict([(r.id, r) for r in existing])
+        # normalized text -> due times, of existing and to-be-created ones
+        seen={}
+        for r in existing:
+            if r.id not in destroys:
+                seen.setdefault(self.normalize(r.message), []).append(
+                    r.remindAt)
+
+        ops=[]
+        for content, t in creates:
+            if self.__duplicate(seen, content, t):
+                rv.skippedCreates.append((content, t))
+                continue
+            seen.setdefault(self.normalize(content), []).append(t)
+            ops.append(('create', content, formatTime(t)))
+        for id, (content, at) in updates.items():
+            old=byId.get(id)
+            if old is not None \
+                and self.normalize(old.message) == self.normalize(content) \
+                and (at is None or old.remindAt == parseTime(at)):
+                rv.skippedUpdates.append(id)
+                continue
+            ops.append(('update', id, content, at))
+        for id in destroys:
+            ops.append(('destroy', id))
+
+        api=self.api
+        methods={'create': api.create, 'update': api.update,
+            'destroy': api.destroy}
+        results=api._batch([(methods[op[0]],) + op[1:] for op in ops],
+            maxInFlight)
+
+        fresh=[]
+        for op, f in zip(ops, results):
+            if f.exception() is not None:
+                rv.failed.append((op, f.exception()))
+                continue
+            if op[0] == 'create':
+                rv.created.extend(f.value)
+                fresh.extend(f.value)
+            elif op[0] == 'update':
+                rv.updated.append(op[1])
+                fresh.extend(f.value)
+            else:
+                rv.destroyed.append(op[1])
+        self.__apply(rv.updated + rv.destroyed, fresh)
+        return rv
+
+    # Queue changes taken by a flush that couldn't make them again, ahead of
+    # any queued since
+    def __restore(self, creates, updates, destroys):
+        self.lock.acquire()
+        try:
+            self.creates=creates + self.creates
+            updates.update(self.updates)
+            destroys.update(self.destroys)
+            for id in destroys:
+                updates.pop(id, None)
+            self.updates=updates
+            self.destroys=destroys
+        finally:
+            self.lock.release()
+
+    # Bring the remembered list up to date with a flush's changes
+    def __apply(self, changedIds, fresh):
+        gone=dict([(id, 1) for id in changedIds])
+        self.lock.acquire()
+        try:
+            if self.existing is not None:
+                self.existing=[r for r in self.existing
+                    if r.id not in gone] + fresh
+        finally:
+            self.lock.release()
+
 class Page(object):
     """An individual page.
 
@@ -298,41 +2305,58 @@ class Page(object):
 
     """
 
-    title=None
-    id=None
-    emailAddress=None
-    notes=[]
-    lists=[]
-    tags=[]
+    __slots__=('title', 'id', 'emailAddress', 'notes', 'lists', 'tags')
+
+    def __init__(self):
+        self.title=None
+        self.id=None
+        self.emailAddress=None
+        self.notes=[]
+        self.lists=[]
+        self.tags=[]
 
 class SearchResult(object):
     """An individual search result.  The object supports the ability to
     retrieve its full representation based on the type of result.  Retrieving
     a writeboard only returns the id at this point, because no Writeboard
-    API is currently supported"""
+    API is currently supported.
 
-    bp=None         # Backpack instance to enable get
-    pageId=None
-    pageTitle=None
-    type=None
-    containerId=None
+    Results from a local index (bpindex.SearchIndex) also have a score and
+    a snippet of the matching text."""
+
+    __slots__=('bp', 'pageId', 'pageTitle', 'type', 'containerId', 'score',
+        'snippet')
+
+    def __init__(self):
+        self.bp=None         # Backpack instance to enable get
+        self.pageId=None
+        self.pageTitle=None
+        self.type=None
+        self.containerId=None
+        self.score=None
+        self.snippet=None
 
     def get(self):
         """Returns the appropriate representation of itself based type
         
-        list:       Returns the result of Backpack.list.get
+        list:       Returns the result of Backpack.listItem.list
         note:       Returns the result of Backpack.notes.list
         writeboard: Returns (page id, page title, writeboard id)
         email:      Returns the result of Backpack.email.get
+        page:       Returns the result of Backpack.page.get
+
+        Backpack.resolve() gets many of these at once.
         """
         if self.type == 'list':
-            return self.bp.list.get(self.pageId, self.containerId)
+            return self.bp.listItem.list(self.pageId, self.containerId)
         elif self.type == 'note':
             return self.bp.notes.list(self.pageId)
         elif self.type == 'writeboard_link':
             return (self.pageId, self.pageTitle, self.containerId)
         elif self.type == 'email':
             return self.bp.email.get(self.pageId, self.containerId)
+        elif self.type == 'page':
+            return self.bp.page.get(self.pageId)
 
 
 class PageAPI(BackpackAPI):
@@ -351,20 +2375,23 @@ class PageAPI(BackpackAPI):
             scope=unicode(r.getAttribute("scope"))
             title=unicode(r.getAttribute("title"))
 
-            rv.append((id, scope, title))
+            rv.append(PageRef(id, scope, title))
 
         return rv
 
     def _parseSearchResult(self, document):
         rv = []
+        bp = self.client
+        if bp is None:
+            bp = Backpack(self.url, self.key, self.debug, self.pool)
         pages = document.getElementsByTagName("page")
         for p in pages:
             for send in p.getElementsByTagName("send"):
                 sr = SearchResult()
-                sr.bp = Backpack(self.url, self.key, self.debug)
+                sr.bp = bp
                 sr.pageId = int(p.getAttribute("id"))
                 sr.pageTitle = unicode(p.getAttribute("title"))
-                sr.type = send.firstChild.data
+                sr.type = nodeText(send)
                 sr.containerId = int(send.getAttribute("id"))
                 rv.append(sr)
         return rv
@@ -390,7 +2417,7 @@ class PageAPI(BackpackAPI):
         rv.lists=self._parseLists(page)
 
         for tag in self.__linkIter(page, "tags", "tag"):
-            rv.tags.append( (int(tag.getAttribute("id")),
+            rv.tags.append(Tag(int(tag.getAttribute("id")),
                 unicode(tag.getAttribute("name"))))
 
         return rv
@@ -400,7 +2427,7 @@ class PageAPI(BackpackAPI):
         
            Returns a list of (id, scope, title) tuples.
         """
-        x=self._call("/ws/pages/all")
+        x=self._call("/ws/pages/all", safe=True)
 
         return self._parsePageList(x)
 
@@ -409,19 +2436,18 @@ class PageAPI(BackpackAPI):
         
            Returns a Page instance.
         """
-        x=self._call("/ws/page/%d" % (id,))
+        x=self._call("/ws/page/%d" % (id,), safe=True)
 
         return self._parsePage(x)
 
+    @_notifies('page')
     def create(self, title):
         """Create a new page.
 
            Returns (id, title)"""
 
-        data="<page><title>%s</title></page>" \
-            % (title,)
         try:
-            x=self._call("/ws/pages/new", data)
+            x=self._request(_PAGE_CREATE, title=title)
         except urllib2.HTTPError, e:
             # A 403 occurs when a page already exists.
             if e.code == 403:
@@ -430,8 +2456,10 @@ class PageAPI(BackpackAPI):
                 raise e
 
         p=x.getElementsByTagName("page")[0]
-        return (int(p.getAttribute("id")), unicode(p.getAttribute("title")))
+        return PageTitle(int(p.getAttribute("id")),
+            unicode(p.getAttribute("title")))
 
+    @_notifies('page')
     def destroy(self, id):
         """Delete a page"""
         x=self._call("/ws/page/%d/destroy" % (id,))
@@ -441,30 +2469,31 @@ class PageAPI(BackpackAPI):
         
         Returns a list of SearchResult objects.
         """
-        data="<term>%s</term>" % term
-        x = self._call("/ws/pages/search", data)
+        x=self._request(_PAGE_SEARCH, safe=True, term=term)
         return self._parseSearchResult(x)
 
+    @_notifies('page')
     def updateTitle(self, id, title):
         """Update a title"""
-        data="<page><title>%s</title></page>" % (title,)
-        x=self._call("/ws/page/%d/update_title" % (id,), data)
+        x=self._request(_PAGE_UPDATE_TITLE, id=id, title=title)
 
+    @_notifies('page')
     def duplicate(self, id):
         """Duplicate a page, get the new (id, title)"""
         x=self._call("/ws/page/%d/duplicate" % (id,))
 
         p=x.getElementsByTagName("page")[0]
-        return (int(p.getAttribute("id")), unicode(p.getAttribute("title")))
+        return PageTitle(int(p.getAttribute("id")),
+            unicode(p.getAttribute("title")))
 
     def share(self, id, emailAddresses=[], isPublic=False):
         """Share this page with others."""
-        data=""
         if len(emailAddresses) > 0:
-            data+="<email_addresses>%s</email_addresses>" \
-                % (' '.join(emailAddresses),)
-        data+="<page><public>%d</public></page>" % (isPublic,)
-        x=self._call("/ws/page/%d/share" % (id,), data)
+            x=self._request(_PAGE_SHARE_WITH, id=id,
+                emailAddresses=' '.join(emailAddresses),
+                isPublic=int(bool(isPublic)))
+        else:
+            x=self._request(_PAGE_SHARE, id=id, isPublic=int(bool(isPublic)))
 
     def unshare(self, id):
         """Unshare a page."""
@@ -482,7 +2511,7 @@ class ExportAPI(PageAPI, ReminderAPI):
         BackpackAPI.__init__(self, u, k, debug)
 
     def _parseDocument(self, docString):
-        document=xml.dom.minidom.parseString(docString)
+        document=self._buildDocument(docString)
         responseEl=document.getElementsByTagName("backpack")[0]
         return document
 
@@ -494,10 +2523,81 @@ class ExportAPI(PageAPI, ReminderAPI):
 
         returns (pages, reminders)
         """
-        x=self._call("/ws/account/export")
+        x=self._call("/ws/account/export", safe=True)
 
         return(self._parseBackup(x))
 
+    # Build a page record from an exported page element
+    def _parseExportedPage(self, page):
+        description=u''
+        for d in page.getElementsByTagName("description"):
+            description=unicode(nodeText(d))
+        return ExportedPage(int(page.getAttribute("id")),
+            unicode(page.getAttribute("title")),
+            unicode(page.getAttribute("email_address")),
+            description,
+            self._parseListItems(page))
+
+    def iterExport(self, chunkSize=16384):
+        """Stream the export of all data from BackPack.
+
+        The response is read and parsed chunkSize bytes at a time, and
+        records are yielded as soon as they're complete:
+
+        * ('page', ExportedPage(id, title, emailAddress, description,
+          items))
+        * ('reminder', Reminder(timestamp, id, message))
+
+        where items are ListItem(id, completedBoolean, text).
+
+        Opening the export is rate limited and retried like any other call,
+        and the hooks get its CallInfo once the stream ends.
+        """
+        done=[]
+        def onEnd(el):
+            if el.tagName == 'error':
+                raise BackpackError(int(el.getAttribute("code")),
+                    unicode(el.text))
+            if el.tagName in ('page', 'reminder'):
+                done.append(el)
+                return True
+        builder=_ExpatBuilder(['error', 'page', 'description', 'item',
+            'reminder'], onEnd)
+
+        path="/ws/account/export"
+        o, info=self._attempt(path, True,
+            lambda info: self._send(path, info))
+        try:
+            try:
+                finished=False
+                while not finished:
+                    start=time.time()
+                    data=o.read(chunkSize)
+                    parsing=time.time()
+                    info.read += parsing - start
+                    info.bytesReceived += len(data)
+                    finished=not data
+                    builder.feed(data, finished)
+                    records=[]
+                    for el in done:
+                        if el.tagName == 'page':
+                            records.append(('page',
+                                self._parseExportedPage(el)))
+                        else:
+                            records.append(('reminder',
+                                self._parseReminder(el)))
+                    del done[:]
+                    info.parse += time.time() - parsing
+                    for record in records:
+                        yield record
+            except Exception:
+                info.error=sys.exc_info()[1]
+                raise
+        finally:
+            o.close()
+            info.total += info.read + info.parse
+            self._fire(info)
+
 
 class ListAPI(BackpackAPI):
     """Backpack list API."""
@@ -506,21 +2606,23 @@ class ListAPI(BackpackAPI):
         """Get a ListAPI object to the given URL and key"""
         BackpackAPI.__init__(self, u, k, debug)
 
+    @_notifies('list')
     def create(self, pageId, name):
         """Creates a new list on the given page
 
         Returns (id, name)
         """
-        data = "<name>%s</name>" % name
-        x = self._call("/ws/page/%d/lists/add" % pageId, data)
+        x = self._request(_LIST_CREATE, pageId=pageId, name=name)
         l = x.getElementsByTagName("list")[0]
-        return ( int(l.getAttribute("id")), unicode(l.getAttribute("name")) )
+        return ListRef(int(l.getAttribute("id")),
+            unicode(l.getAttribute("name")))
 
+    @_notifies('list')
     def update(self, pageId, listId, name):
         """Changes a list's name"""
-        data = "<list><name>%s</name></list>" % name
-        self._call("/ws/page/%d/lists/update/%d" % (pageId, listId), data)
+        self._request(_LIST_UPDATE, pageId=pageId, listId=listId, name=name)
 
+    @_notifies('list')
     def destroy(self, pageId, listId):
         self._call("/ws/page/%d/lists/destroy/%d" % (pageId, listId))
 
@@ -529,7 +2631,7 @@ class ListAPI(BackpackAPI):
         
         list of (id, name)
         """
-        x = self._call("/ws/page/%d/lists/list" % pageId)
+        x = self._call("/ws/page/%d/lists/list" % pageId, safe=True)
         return self._parseLists(x)
     
 class ListItemAPI(BackpackAPI):
@@ -552,41 +2654,204 @@ class ListItemAPI(BackpackAPI):
 
         list of (id, completedBoolean, text)
         """
-        x=self._call("/ws/page/%d/lists/%d/items/list" % (pageId, listId))
+        x=self._call("/ws/page/%d/lists/%d/items/list" % (pageId, listId),
+            safe=True)
         return self._parseListItems(x)
 
+    @_notifies('listItem')
     def create(self, pageId, listId, text):
         """Create a new entry.
         Return (id, completedBoolean, text)"""
-        data="<item><content>%s</content></item>" % (text,)
-        x=self._call("/ws/page/%d/lists/%d/items/add" % (pageId, listId), data)
+        x=self._request(_ITEM_CREATE, pageId=pageId, listId=listId,
+            text=text)
         return self._parseListItems(x)[0]
 
+    @_notifies('listItem')
     def update(self, pageId, listId, id, text):
         """Update an entry."""
-        data="<item><content>%s</content></item>" % (text,)
-        x=self._call("/ws/page/%d/lists/%d/items/update/%d" % 
-                     (pageId, listId, id), data)
+        x=self._request(_ITEM_UPDATE, pageId=pageId, listId=listId, id=id,
+            text=text)
 
+    @_notifies('listItem')
     def toggle(self, pageId, listId, id):
         """Toggle an entry."""
         x=self._call("/ws/page/%d/lists/%d/items/toggle/%d" % 
                      (pageId, listId, id))
 
+    @_notifies('listItem')
     def destroy(self, pageId, listId, id):
         """Destroy an entry."""
         x=self._call("/ws/page/%d/lists/%d/items/destroy/%d" % 
                 (pageId, listId, id))
 
+    @_notifies('listItem')
     def move(self, pageId, listId, id, direction):
         """Move an entry.
         
         direction can be 'move_lower', 'move_higher', 
                          'move_to_top', and 'move_to_bottom'
         """
-        data="<direction>%s</direction>" % (direction,)
-        x=self._call("/ws/page/%d/lists/%d/items/move/%d" % 
-                (pageId, listId, id), data)
+        x=self._request(_ITEM_MOVE, pageId=pageId, listId=listId, id=id,
+            direction=direction)
+
+    # The bulk methods below run their requests concurrently (through the
+    # owning Backpack's batch()) and return a completed Future per input,
+    # in order.  backpack.failures() lists the ones that failed.
+
+    def createMany(self, pageId, listId, texts, maxInFlight=None):
+        """Create many entries.
+
+        Each Future's value is the new (id, completedBoolean, text).  The
+        entries are created concurrently, so they may not land on the list
+        in the order given; use reorder() if that matters."""
+        return self._batch([(self.create, pageId, listId, text)
+            for text in texts], maxInFlight)
+
+    def updateMany(self, pageId, listId, updates, maxInFlight=None):
+        """Update many entries from a sequence of (id, text)."""
+        return self._batch([(self.update, pageId, listId, id, text)
+            for id, text in updates], maxInFlight)
+
+    def toggleMany(self, pageId, listId, ids, maxInFlight=None):
+        """Toggle many entries."""
+        return self._batch([(self.toggle, pageId, listId, id)
+            for id in ids], maxInFlight)
+
+    def destroyMany(self, pageId, listId, ids, maxInFlight=None):
+        """Destroy many entries."""
+        return self._batch([(self.destroy, pageId, listId, id)
+            for id in ids], maxInFlight)
+
+    def planReorder(current, target):
+        """Get the moves that turn the current order of ids into target.
+
+        Returns a list of (id, direction).  Two plans are worked out and
+        the one with fewer moves is used:
+
+        * Keep the longest run of the target that's already in order, and
+          move everything before it to the top and everything after it to
+          the bottom.  This suits big rearrangements.
+        * Keep the longest sequence of items already in order (not
+          necessarily next to each other), and walk each other item to its
+          place one move_higher or move_lower at a time, or move it to the
+          top or bottom if that's where it goes.  This suits small edits;
+          a swap of neighbors is one move.
+        """
+        if len(current) != len(target) or \
+            dict.fromkeys(current) != dict.fromkeys(target):
+            raise ValueError("Target must be a reordering of the list")
+        if current == target:
+            return []
+        rv=ListItemAPI._planEnds(current, target)
+        return ListItemAPI._planSteps(current, target, len(rv)) or rv
+    planReorder=staticmethod(planReorder)
+
+    def _planEnds(current, target):
+        # Keep the longest run of target in current order, moving the rest
+        # to the ends
+        pos={}
+        for i in range(len(current)):
+            pos[current[i]]=i
+        bestStart, bestLen=0, 1
+        start=0
+        for i in range(1, len(target) + 1):
+            if i == len(target) or pos[target[i]] < pos[target[i - 1]]:
+                if i - start > bestLen:
+                    bestStart, bestLen=start, i - start
+                start=i
+
+        rv=[]
+        for i in range(bestStart - 1, -1, -1):
+            rv.append((target[i], ListItemAPI.MOVE_TO_TOP))
+        for i in range(bestStart + bestLen, len(target)):
+            rv.append((target[i], ListItemAPI.MOVE_TO_BOTTOM))
+        return rv
+    _planEnds=staticmethod(_planEnds)
+
+    def _planSteps(current, target, limit):
+        # Keep the longest increasing subsequence of target's positions in
+        # current, and walk the rest into place.  Returns None if that takes
+        # more than limit moves.
+        pos={}
+        for i in range(len(current)):
+            pos[current[i]]=i
+        seq=[pos[t] for t in target]
+        # tails[k] is the index in seq ending the best subsequence of
+        # length k + 1 found so far
+        tails=[]
+        prev=[None] * len(seq)
+        for i in range(len(seq)):
+            lo, hi=0, len(tails)
+            while lo < hi:
+                mid=(lo + hi) / 2
+                if seq[tails[mid]] < seq[i]:
+                    lo=mid + 1
+                else:
+                    hi=mid
+            if lo > 0:
+                prev[i]=tails[lo - 1]
+            if lo == len(tails):
+                tails.append(i)
+            else:
+                tails[lo]=i
+        kept={}
+        i=tails[-1]
+        while i is not None:
+            kept[target[i]]=True
+            i=prev[i]
+
+        # Place the others in target order, each just after the item before
+        # it in the target, which is in place by then
+        rv=[]
+        order=list(current)
+        for k in range(len(target)):
+            id=target[k]
+            if id in kept:
+                continue
+            i=order.index(id)
+            del order[i]
+            if k == 0:
+                dest=0
+            else:
+                dest=order.index(target[k - 1]) + 1
+            order.insert(dest, id)
+            if dest == 0 and i > 1:
+                rv.append((id, ListItemAPI.MOVE_TO_TOP))
+            elif dest == len(order) - 1 and dest - i > 1:
+                rv.append((id, ListItemAPI.MOVE_TO_BOTTOM))
+            elif dest > i:
+                rv.extend([(id, ListItemAPI.MOVE_LOWER)] * (dest - i))
+            else:
+                rv.extend([(id, ListItemAPI.MOVE_HIGHER)] * (i - dest))
+            if len(rv) > limit:
+                return None
+        return rv
+    _planSteps=staticmethod(_planSteps)
+
+    def reorder(self, pageId, listId, target, current=None):
+        """Rearrange a list so its item ids are in the target order.
+
+        The current order is fetched unless given.  The moves from
+        planReorder() depend on each other, so they're made one at a time.
+        Returns a Future per move with the (id, direction) as its value;
+        once a move fails the remaining ones aren't attempted and report
+        the same failure."""
+        if current is None:
+            current=[item[0] for item in self.list(pageId, listId)]
+        rv=[]
+        excInfo=None
+        for id, direction in self.planReorder(list(current), list(target)):
+            f=Future()
+            if excInfo is None:
+                try:
+                    self.move(pageId, listId, id, direction)
+                    f._set((id, direction))
+                except:
+                    excInfo=sys.exc_info()
+            if excInfo is not None:
+                f._set(excInfo=excInfo)
+            rv.append(f)
+        return rv
 
 class NoteAPI(BackpackAPI):
     """API to Backpack Notes for a page."""
@@ -600,21 +2865,23 @@ class NoteAPI(BackpackAPI):
 
         list of (id, title, timestamp, text)
         """
-        x=self._call("/ws/page/%d/notes/list" % pageId)
+        x=self._call("/ws/page/%d/notes/list" % pageId, safe=True)
         return self._parseNotes(x)
 
+    @_notifies('notes')
     def create(self, pageId, title, body):
         """Create a new entry.
         Return (id, title, timestamp, text)"""
-        data="<note><title>%s</title><body>%s</body></note>" % (title, body)
-        x=self._call("/ws/page/%d/notes/create" % (pageId,), data)
+        x=self._request(_NOTE_CREATE, pageId=pageId, title=title, body=body)
         return self._parseNotes(x)[0]
 
+    @_notifies('notes')
     def update(self, pageId, noteId, title, body):
         """Update a note."""
-        data="<note><title>%s</title><body>%s</body></note>" % (title, body)
-        x=self._call("/ws/page/%d/notes/update/%d" % (pageId, noteId), data)
+        x=self._request(_NOTE_UPDATE, pageId=pageId, noteId=noteId,
+            title=title, body=body)
 
+    @_notifies('notes')
     def destroy(self, pageId, noteId):
         """Delete a note."""
         x=self._call("/ws/page/%d/notes/destroy/%d" % (pageId, noteId))
@@ -629,10 +2896,10 @@ class EmailAPI(BackpackAPI):
     def _parseEmails(self, x):
         rv=[]
         for item in x.getElementsByTagName("email"):
-            rv.append((int(item.getAttribute("id")),
+            rv.append(Email(int(item.getAttribute("id")),
                 unicode(item.getAttribute("subject")),
                 parseTime(item.getAttribute("created_at")),
-                item.firstChild.data))
+                nodeText(item)))
         return rv
 
     def list(self, pageId):
@@ -640,7 +2907,7 @@ class EmailAPI(BackpackAPI):
 
         list of (id, subject, timestamp, text)
         """
-        x=self._call("/ws/page/%d/emails/list" % pageId)
+        x=self._call("/ws/page/%d/emails/list" % pageId, safe=True)
         return self._parseEmails(x)
 
     def get(self, pageId, mailId):
@@ -648,9 +2915,11 @@ class EmailAPI(BackpackAPI):
 
         (id, subject, timestamp, text)
         """
-        x=self._call("/ws/page/%d/emails/show/%d" % (pageId, mailId))
+        x=self._call("/ws/page/%d/emails/show/%d" % (pageId, mailId),
+            safe=True)
         return self._parseEmails(x)[0]
 
+    @_notifies('email')
     def destroy(self, pageId, mailId):
         """Delete an email."""
         x=self._call("/ws/page/%d/emails/destroy/%d" % (pageId, mailId))
@@ -665,7 +2934,7 @@ class TagAPI(BackpackAPI):
     def _parseTaggedPageList(self, x):
         rv=[]
         for item in x.getElementsByTagName("page"):
-            rv.append((int(item.getAttribute("id")),
+            rv.append(PageTitle(int(item.getAttribute("id")),
                 unicode(item.getAttribute("title"))))
         return rv
 
@@ -674,7 +2943,7 @@ class TagAPI(BackpackAPI):
         
         return a list of (id, title)
         """
-        x=self._call("/ws/tags/select/%d" % tagId)
+        x=self._call("/ws/tags/select/%d" % tagId, safe=True)
         return self._parseTaggedPageList(x)
 
     def _cleanTags(self, tags):
@@ -689,10 +2958,11 @@ class TagAPI(BackpackAPI):
                 cleanedTags.append(t)
         return cleanedTags
 
+    @_notifies('tags')
     def tagPage(self, pageId, tags):
         """Tag a page with a list of words."""
-        data="<tags>%s</tags>" % ' '.join(self._cleanTags(tags))
-        x=self._call("/ws/page/%d/tags/tag" % pageId, data)
+        x=self._request(_TAG_PAGE, pageId=pageId,
+            tags=' '.join(self._cleanTags(tags)))
 
 class Backpack(object):
     """Interface to all of the backpack APIs.
@@ -704,6 +2974,11 @@ class Backpack(object):
        * tags - TagAPI object
        * email - EmailAPI object
        * export - ExportAPI object
+
+       All of the APIs share one ConnectionPool and, if one is given, one
+       ResponseCache.  Many calls can be run concurrently with batch(),
+       hooks added with addHook() see the details of every call, and
+       listeners added with addListener() see every change made.
     """
 
     reminder=None
@@ -713,9 +2988,22 @@ class Backpack(object):
     email=None
     tags=None
     export=None
-
-    def __init__(self, url, key, debug=False):
-        """Initialize the backpack APIs."""
+    pool=None
+    cache=None
+    retry=None
+    limiter=None
+    maxInFlight=4
+
+    def __init__(self, url, key, debug=False, pool=None, maxInFlight=4,
+        cache=None, retry=None, limiter=None):
+        """Initialize the backpack APIs.
+
+        If no ConnectionPool is given, a default one is created.
+        maxInFlight is the most requests batch() will have running at once.
+        Responses to read-only calls are cached if a ResponseCache is given,
+        and failed calls are retried according to retry, a RetryPolicy.
+        Requests to the server are paced by limiter, a RateLimiter.
+        """
         self.reminder=ReminderAPI(url, key, debug)
         self.page=PageAPI(url, key, debug)
         self.list=ListAPI(url, key, debug)
@@ -724,3 +3012,200 @@ class Backpack(object):
         self.email=EmailAPI(url, key, debug)
         self.tags=TagAPI(url, key, debug)
         self.export=ExportAPI(url, key, debug)
+
+        if pool is None:
+            pool=ConnectionPool()
+        self.pool=pool
+        self.cache=cache
+        self.retry=retry
+        self.limiter=limiter
+        self.hooks=[]
+        self.listeners=[]
+        for api in self.apis():
+            api.pool=pool
+            api.cache=cache
+            api.retry=retry
+            api.limiter=limiter
+            api.hooks=self.hooks
+            api.listeners=self.listeners
+            api.client=self
+
+        self.maxInFlight=maxInFlight
+        self.__executor=None
+        self.__lock=threading.Lock()
+
+    def apis(self):
+        """Get all of the API objects."""
+        return [self.reminder, self.page, self.list, self.listItem,
+            self.notes, self.email, self.tags, self.export]
+
+    def resolve(self, results):
+        """Get the representation of many SearchResults at once.
+
+        Returns what get() would for each result, in order.  Results on the
+        same page share requests:  one notes list per page, one item list
+        per list, and one email list per page with several email hits.  The
+        requests are made concurrently with batch(), and the first failure
+        is raised.
+        """
+        emailsPerPage={}
+        for r in results:
+            if r.type == 'email':
+                emailsPerPage[r.pageId]=emailsPerPage.get(r.pageId, 0) + 1
+
+        # fetch key -> call, and the fetch key for each result
+        calls={}
+        keys=[]
+        for r in results:
+            if r.type == 'list':
+                k=('list', r.pageId, r.containerId)
+                calls[k]=(self.listItem.list, r.pageId, r.containerId)
+            elif r.type == 'note':
+                k=('note', r.pageId)
+                calls[k]=(self.notes.list, r.pageId)
+            elif r.type == 'email' and emailsPerPage[r.pageId] > 1:
+                k=('emails', r.pageId)
+                calls[k]=(self.email.list, r.pageId)
+            elif r.type == 'email':
+                k=('email', r.pageId, r.containerId)
+                calls[k]=(self.email.get, r.pageId, r.containerId)
+            elif r.type == 'page':
+                k=('page', r.pageId)
+                calls[k]=(self.page.get, r.pageId)
+            else:
+                k=None
+            keys.append(k)
+
+        fetchKeys=calls.keys()
+        fetched={}
+        for k, f in zip(fetchKeys, self.batch([calls[k] for k in fetchKeys])):
+            fetched[k]=f.result()
+
+        rv=[]
+        for r, k in zip(results, keys):
+            if k is None:
+                rv.append(r.get())
+            elif k[0] == 'emails':
+                emails=[e for e in fetched[k] if e[0] == r.containerId]
+                if not emails:
+                    raise BackpackError(404, "Record not found")
+                rv.append(emails[0])
+            else:
+                rv.append(fetched[k])
+        return rv
+
+    def addHook(self, hook):
+        """Call hook with a CallInfo after every API call."""
+        self.hooks.append(hook)
+
+    def removeHook(self, hook):
+        """Stop calling a hook added with addHook."""
+        self.hooks.remove(hook)
+
+    def addListener(self, listener):
+        """Call listener with a Change after every successful API call that
+        changes the account.  Concurrent calls may call it from several
+        threads at once."""
+        self.listeners.append(listener)
+
+    def removeListener(self, listener):
+        """Stop calling a listener added with addListener."""
+        self.listeners.remove(listener)
+
+    def executor(self):
+        """Get the Executor used for concurrent calls."""
+        self.__lock.acquire()
+        try:
+            if self.__executor is None:
+                self.__executor=Executor(self.maxInFlight)
+            return self.__executor
+        finally:
+            self.__lock.release()
+
+    def batch(self, calls, maxInFlight=None):
+        """Run many calls concurrently.
+
+        Each call is a sequence of a callable and its arguments, e.g.
+
+            bp.batch([(bp.page.get, 1133), (bp.notes.list, 1133)])
+
+        At most maxInFlight (default self.maxInFlight) calls run at once;
+        the executor gets more workers if that's more than it has.
+        Returns a completed Future for each call, in order; use result() to
+        get the value (or raise the call's exception) or exception() to
+        inspect failures.
+
+        A batch started from one of the executor's own workers (by an
+        AsyncBackpack method, or a call in another batch) runs its calls
+        one at a time on that worker, since waiting for other workers
+        could deadlock once they're all waiting too.
+        """
+        if maxInFlight is None:
+            maxInFlight=self.maxInFlight
+        executor=self.executor()
+        if executor.isWorker():
+            return _runCalls(calls)
+        executor.grow(maxInFlight)
+        slots=threading.Semaphore(maxInFlight)
+        release=lambda f: slots.release()
+        rv=[]
+        for call in calls:
+            slots.acquire()
+            f=executor.submit(call[0], *call[1:])
+            f.addCallback(release)
+            rv.append(f)
+        for f in rv:
+            f.wait()
+        return rv
+
+
+class _AsyncAPI(object):
+    """Wraps an API object so its public methods run on an Executor and
+    return Futures."""
+
+    def __init__(self, api, executor):
+        self.api=api
+        self.executor=executor
+
+    def __getattr__(self, name):
+        attr=getattr(self.api, name)
+        if name[0] == '_' or not callable(attr):
+            return attr
+        def submit(*args, **kwargs):
+            return self.executor.submit(attr, *args, **kwargs)
+        submit.__name__=name
+        submit.__doc__=attr.__doc__
+        return submit
+
+class AsyncBackpack(object):
+    """Non-blocking interface to all of the backpack APIs.
+
+    This has the same APIs as Backpack, but every method returns a Future
+    right away, and the call itself runs on a pool of worker threads:
+
+        f=abp.page.get(1133)
+        ...
+        page=f.result()
+
+    Up to maxInFlight calls run at once over a shared ConnectionPool,
+    which is sized to match if not given.  The underlying blocking
+    Backpack is available as sync.
+    """
+
+    def __init__(self, url, key, debug=False, pool=None, maxInFlight=32,
+        cache=None, retry=None, limiter=None):
+        """Initialize the backpack APIs."""
+        if pool is None:
+            pool=ConnectionPool(size=maxInFlight, maxPerHost=maxInFlight)
+        self.sync=Backpack(url, key, debug, pool, maxInFlight, cache, retry,
+            limiter)
+        self.pool=pool
+        executor=self.sync.executor()
+        self.reminder=_AsyncAPI(self.sync.reminder, executor)
+        self.page=_AsyncAPI(self.sync.page, executor)
+        self.list=_AsyncAPI(self.sync.list, executor)
+        self.listItem=_AsyncAPI(self.sync.listItem, executor)
+        self.notes=_AsyncAPI(self.sync.notes, executor)
+        self.email=_AsyncAPI(self.sync.email, executor)
+        self.tags=_AsyncAPI(self.sync.tags, executor)
+        self.export=_AsyncAPI(self.sync.export, executor)
@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+"""
+Offline benchmarks for the backpack parsers and client.
+
+Every parser is run against the fixtures in data/, as is, and scaled up by
+repeating their records.  Each case is run with both response parsers and
+reports ops/sec, p50/p99 latency and the peak memory used by one run.
+
+    # Run the default scales and save the results
+    python bpbench.py --save before.json
+    # ... make changes ...
+    python bpbench.py --scales 1,10,100,1000,10000 --compare before.json
+
+When comparing, a case that's more than --threshold percent slower than
+the saved run is reported as a regression and the exit status is 1.
+"""
+
+import os
+import re
+import sys
+import time
+import optparse
+from StringIO import StringIO
+
+try:
+    import json
+except ImportError:
+    json=None
+
+try:
+    import resource
+except ImportError:
+    resource=None
+
+import backpack
+
+# (name, API class, fixture, parse method, elements repeated when scaling)
+PARSER_CASES=[
+    ('page', backpack.PageAPI, 'data/page.xml', '_parsePage',
+        ['note', 'list', 'tag']),
+    ('search', backpack.PageAPI, 'data/search.xml', '_parseSearchResult',
+        ['page']),
+    ('backup', backpack.ExportAPI, 'data/export.xml', '_parseBackup',
+        ['page', 'reminder']),
+    ('emails', backpack.EmailAPI, 'data/emaillist.xml', '_parseEmails',
+        ['email']),
+    ('listItems', backpack.ListItemAPI, 'data/listitem.xml',
+        '_parseListItems', ['item']),
+    ('notes', backpack.NoteAPI, 'data/notelist.xml', '_parseNotes',
+        ['note']),
+    ('reminders', backpack.ReminderAPI, 'data/reminders.xml',
+        '_parseReminders', ['reminder']),
+]
+
+# (name, API class, fixture, method, args, elements repeated when scaling)
+CLIENT_CASES=[
+    ('call:reminder.list', backpack.ReminderAPI, 'data/reminders.xml',
+        'list', (), ['reminder']),
+    ('call:listItem.list', backpack.ListItemAPI, 'data/listitem.xml',
+        'list', (1, 1), ['item']),
+]
+
+PARSERS=['expat', 'minidom']
+
+def scale(data, elements, n):
+    """Repeat every occurrence of the given elements n times."""
+    for el in elements:
+        regex=re.compile(r'<%s\b[^>]*?(/>|>.*?</%s>)' % (el, el), re.S)
+        data=regex.sub(lambda m: m.group(0) * n, data)
+    return data
+
+def percentile(sortedTimes, p):
+    """Get the pth percentile of a sorted list."""
+    i=int(round((len(sortedTimes) - 1) * p / 100.0))
+    return sortedTimes[i]
+
+def peakMemory(fn):
+    """Run fn in a child process, returning the growth in peak RSS in KB.
+
+    Returns None where that can't be measured."""
+    if resource is None or not hasattr(os, 'fork'):
+        return None
+    r, w=os.pipe()
+    pid=os.fork()
+    if pid == 0:
+        os.close(r)
+        rv=-1
+        try:
+            before=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            fn()
+            rv=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before
+        finally:
+            os.write(w, str(rv))
+            os._exit(0)
+    os.close(w)
+    data=os.read(r, 64)
+    os.close(r)
+    os.waitpid(pid, 0)
+    rv=int(data)
+    if rv < 0:
+        return None
+    return rv
+
+def measure(fn, minTime=0.5, minRuns=5):
+    """Run fn repeatedly, returning a result dict."""
+    times=[]
+    start=time.time()
+    while len(times) < minRuns or time.time() - start < minTime:
+        t=time.time()
+        fn()
+        times.append(time.time() - t)
+    times.sort()
+    return {'runs': len(times),
+        'opsPerSec': len(times) / sum(times),
+        'p50': percentile(times, 50),
+        'p99': percentile(times, 99),
+        'peakKB': peakMemory(fn)}
+
+def parserCase(cls, data, method, parser):
+    api=cls("http://localhost/", "bench")
+    api.parser=parser
+    parse=getattr(api, method)
+    return lambda: parse(api._parseDocument(data))
+
+def clientCase(cls, data, method, args, parser):
+    api=cls("http://localhost/", "bench")
+    api.parser=parser
+    api._open=lambda path, d="": StringIO(data)
+    call=getattr(api, method)
+    return lambda: call(*args)
+
+def cases(scales):
+    """Generate (name, scale, parser, function) for every case."""
+    for name, cls, fixture, method, elements in PARSER_CASES:
+        base=open(fixture).read()
+        for n in scales:
+            data=scale(base, elements, n)
+            for parser in PARSERS:
+                yield name, n, parser, parserCase(cls, data, method, parser)
+    for name, cls, fixture, method, args, elements in CLIENT_CASES:
+        base=open(fixture).read()
+        for n in scales:
+            data=scale(base, elements, n)
+            for parser in PARSERS:
+                yield name, n, parser, clientCase(cls, data, method, args,
+                    parser)
+
+def key(name, n, parser):
+    return "%s x%d %s" % (name, n, parser)
+
+def run(scales, minTime, only=None):
+    """Run the benchmarks, returning {key: result}."""
+    rv={}
+    for name, n, parser, fn in cases(scales):
+        if only and not re.search(only, name):
+            continue
+        k=key(name, n, parser)
+        rv[k]=measure(fn, minTime)
+        report(k, rv[k])
+    return rv
+
+def report(k, r):
+    peak='-'
+    if r['peakKB'] is not None:
+        peak="%dKB" % (r['peakKB'],)
+    print "%-34s %10.1f ops/s  p50 %9.3fms  p99 %9.3fms  peak %8s" \
+        % (k, r['opsPerSec'], r['p50'] * 1000, r['p99'] * 1000, peak)
+
+def compare(old, new, threshold):
+    """Print the differences between two runs, returning the regressions."""
+    regressions=[]
+    print
+    print "%-34s %12s %12s %8s" % ("case", "old ops/s", "new ops/s", "change")
+    keys=[k for k in new.keys() if k in old]
+    keys.sort()
+    for k in keys:
+        o=old[k]['opsPerSec']
+        n=new[k]['opsPerSec']
+        change=(n - o) / o * 100
+        flag=''
+        if change < -threshold:
+            flag=' REGRESSION'
+            regressions.append(k)
+        print "%-34s %12.1f %12.1f %+7.1f%%%s" % (k, o, n, change, flag)
+    return regressions
+
+def main():
+    parser=optparse.OptionParser(usage="%prog [options]")
+    parser.add_option("--scales", default="1,10,100",
+        help="comma separated fixture scale factors [%default]")
+    parser.add_option("--time", type="float", default=0.5,
+        help="minimum seconds to run each case [%default]")
+    parser.add_option("--only", help="only run cases matching this regex")
+    parser.add_option("--save", help="save results to this file")
+    parser.add_option("--compare", help="compare with results in this file")
+    parser.add_option("--threshold", type="float", default=10.0,
+        help="percent slowdown counted as a regression [%default]")
+    opts, args=parser.parse_args()
+    if json is None and (opts.save or opts.compare):
+        parser.error("saving and comparing results requires json")
+
+    scales=[int(s) for s in opts.scales.split(',')]
+    results=run(scales, opts.time, opts.only)
+
+    if opts.save:
+        f=open(opts.save, "w")
+        json.dump(results, f, indent=1, sort_keys=True)
+        f.close()
+
+    if opts.compare:
+        f=open(opts.compare)
+        old=json.load(f)
+        f.close()
+        if compare(old, results, opts.threshold):
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
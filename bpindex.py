@@ -0,0 +1,743 @@
+#!/usr/bin/env python
+"""
+Local indexes over a Backpack account, kept current by the client's own
+changes.
+
+ReminderIndex keeps the reminders in due order, so "what's due soon" is a
+lookup rather than a list() and a scan, and a notifier can block until the
+next one is due:
+
+    index=bpindex.ReminderIndex(bp)
+    index.refresh()
+    print index.between(time.time(), time.time() + 3600)
+    for reminder in index.due():
+        notify(reminder.message)
+
+SearchIndex is an inverted index of the text of pages, notes, list items
+and emails, answering searches with ranked SearchResults without asking
+the server:
+
+    index=bpindex.SearchIndex(bp)
+    index.build()
+    for result in index.search("tomatoes"):
+        print result.pageTitle, result.score, result.snippet
+
+TagIndex maps tags to the pages that have them, so tag queries combine
+sets locally instead of calling pagesForTag() once per tag:
+
+    tags=bpindex.TagIndex(bp)
+    tags.build()
+    print tags.select(all=["garden", "todo"], exclude=["done"])
+
+Changes made through bp (reminder.create(), notes.update() and so on) are
+applied to the indexes as they happen.  Changes made elsewhere are only
+seen by the next refresh() or build().
+"""
+
+import re
+import math
+import time
+import bisect
+import threading
+
+import backpack
+
+class ReminderIndex(object):
+    """Reminders sorted by due time.
+
+    * bp - the Backpack the reminders come from, and whose changes are
+      followed
+    """
+
+    def __init__(self, bp):
+        self.bp=bp
+        # id -> Reminder
+        self.reminders={}
+        # (remindAt, id) of every reminder, sorted
+        self.keys=[]
+        self.cond=threading.Condition()
+        self.listening=True
+        bp.addListener(self._changed)
+
+    def close(self):
+        """Stop following the client's changes."""
+        if self.listening:
+            self.bp.removeListener(self._changed)
+            self.listening=False
+
+    def load(self, reminders):
+        """Replace the contents of the index with the given Reminders."""
+        byId=dict([(r.id, r) for r in reminders])
+        keys=[(r.remindAt, r.id) for r in byId.values()]
+        keys.sort()
+        self.cond.acquire()
+        try:
+            self.reminders=byId
+            self.keys=keys
+            self.cond.notifyAll()
+        finally:
+            self.cond.release()
+
+    def refresh(self):
+        """Load the reminders from reminder.list()."""
+        self.load(self.bp.reminder.list())
+
+    def seed(self):
+        """Load the reminders from the account export."""
+        self.load([r for kind, r in self.bp.export.iterExport()
+            if kind == 'reminder'])
+
+    # Must be called with the lock held
+    def __remove(self, id):
+        r=self.reminders.pop(id, None)
+        if r is not None:
+            i=bisect.bisect_left(self.keys, (r.remindAt, id))
+            del self.keys[i]
+
+    # Must be called with the lock held
+    def __add(self, r):
+        self.__remove(r.id)
+        self.reminders[r.id]=r
+        bisect.insort(self.keys, (r.remindAt, r.id))
+
+    def add(self, reminder):
+        """Add or replace a reminder."""
+        self.cond.acquire()
+        try:
+            self.__add(reminder)
+            self.cond.notifyAll()
+        finally:
+            self.cond.release()
+
+    def remove(self, id):
+        """Remove a reminder."""
+        self.cond.acquire()
+        try:
+            self.__remove(id)
+            self.cond.notifyAll()
+        finally:
+            self.cond.release()
+
+    def _changed(self, change):
+        if change.api != 'reminder':
+            return
+        if change.method == 'destroy':
+            self.remove(change.args[0])
+        else:
+            for r in change.result:
+                self.add(r)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def get(self, id):
+        """Get a reminder by id, or None."""
+        return self.reminders.get(id)
+
+    def between(self, start, end):
+        """Get the reminders due at or after start and before end, in
+        order."""
+        self.cond.acquire()
+        try:
+            lo=bisect.bisect_left(self.keys, (start,))
+            hi=bisect.bisect_left(self.keys, (end,))
+            return [self.reminders[id] for t, id in self.keys[lo:hi]]
+        finally:
+            self.cond.release()
+
+    def nextDue(self, after=None):
+        """Get the first reminder due at or after the given time (default
+        now), or None."""
+        if after is None:
+            after=time.time()
+        self.cond.acquire()
+        try:
+            i=bisect.bisect_left(self.keys, (after,))
+            if i == len(self.keys):
+                return None
+            return self.reminders[self.keys[i][1]]
+        finally:
+            self.cond.release()
+
+    def due(self, since=None, until=None):
+        """Yield reminders as they come due, in order.
+
+        Starts with the ones due at since (default now), and blocks until
+        each is due.  Reminders added or moved while waiting are picked up.
+        Stops once until has passed, or never if it isn't given."""
+        if since is None:
+            since=time.time()
+        # Everything before this has been yielded
+        position=(since,)
+        while True:
+            self.cond.acquire()
+            try:
+                while True:
+                    now=time.time()
+                    i=bisect.bisect_left(self.keys, position)
+                    if i < len(self.keys) and self.keys[i][0] <= now:
+                        key=self.keys[i]
+                        r=self.reminders[key[1]]
+                        break
+                    if until is not None and now >= until:
+                        return
+                    wakeAt=until
+                    if i < len(self.keys) and (wakeAt is None
+                        or self.keys[i][0] < wakeAt):
+                        wakeAt=self.keys[i][0]
+                    if wakeAt is None:
+                        self.cond.wait()
+                    else:
+                        self.cond.wait(wakeAt - now)
+            finally:
+                self.cond.release()
+            # Just past this key
+            position=(key[0], key[1] + 1)
+            yield r
+
+_WORD=re.compile(r'\w+', re.U)
+
+def _unicode(s):
+    # Text from arguments may be UTF-8 encoded
+    if isinstance(s, str):
+        return s.decode("utf-8", "replace")
+    return s
+
+def tokenize(text):
+    """Get the lowercased words of some text."""
+    return _WORD.findall(text.lower())
+
+class SearchIndex(object):
+    """A full-text index of an account.
+
+    Each page title and description, note, list item and email is a
+    document.  search() finds the documents containing every word of a
+    query, ranks them by TF-IDF and returns one SearchResult per container
+    (a note, list, email or the page itself), the way PageAPI.search()
+    does.
+
+    * bp - the Backpack the data comes from, and whose changes are followed
+    * snippetSize - roughly how many characters of text a snippet shows
+    """
+
+    def __init__(self, bp, snippetSize=80):
+        self.bp=bp
+        self.snippetSize=snippetSize
+        self.lock=threading.Lock()
+        self.__clear()
+        self.listening=True
+        bp.addListener(self._changed)
+
+    def close(self):
+        """Stop following the client's changes."""
+        if self.listening:
+            self.bp.removeListener(self._changed)
+            self.listening=False
+
+    def __clear(self):
+        # word -> {document key: occurrences}
+        self.postings={}
+        # document key -> (SearchResult type, page id, container id, text,
+        # {word: occurrences})
+        self.documents={}
+        # page id -> title
+        self.titles={}
+        # page id -> description
+        self.descriptions={}
+        # Pages whose notes, lists and emails need fetching again
+        self.stalePages=set()
+
+    def __len__(self):
+        return len(self.documents)
+
+    # Index changes; these must be called with the lock held
+
+    def __add(self, key, type, pageId, containerId, text):
+        self.__remove(key)
+        counts={}
+        for word in tokenize(text):
+            counts[word]=counts.get(word, 0) + 1
+        self.documents[key]=(type, pageId, containerId, text, counts)
+        for word, n in counts.items():
+            self.postings.setdefault(word, {})[key]=n
+
+    def __remove(self, key):
+        doc=self.documents.pop(key, None)
+        if doc is None:
+            return
+        for word in doc[4]:
+            postings=self.postings[word]
+            del postings[key]
+            if not postings:
+                del self.postings[word]
+
+    def __removeWhere(self, match):
+        for key, doc in self.documents.items():
+            if match(doc):
+                self.__remove(key)
+
+    def __page(self, pageId, title=None, description=None):
+        if title is not None:
+            self.titles[pageId]=_unicode(title)
+        if description is not None:
+            self.descriptions[pageId]=_unicode(description)
+        self.__add(('page', pageId), 'page', pageId, pageId,
+            self.titles.get(pageId, u'') + u'\n'
+            + self.descriptions.get(pageId, u''))
+
+    def __note(self, pageId, id, title, body):
+        self.__add(('note', id), 'note', pageId, id,
+            _unicode(title) + u'\n' + _unicode(body))
+
+    def __item(self, pageId, listId, id, text):
+        self.__add(('item', id), 'list', pageId, listId, _unicode(text))
+
+    def __email(self, pageId, id, subject, body):
+        self.__add(('email', id), 'email', pageId, id,
+            _unicode(subject) + u'\n' + _unicode(body))
+
+    # Loading
+
+    def _fetchPage(self, pageId):
+        """Get (notes, [(listId, items)], emails) for a page."""
+        bp=self.bp
+        lists=[(l.id, bp.listItem.list(pageId, l.id))
+            for l in bp.list.list(pageId)]
+        return bp.notes.list(pageId), lists, bp.email.list(pageId)
+
+    def build(self):
+        """(Re)build the index from the export and each page's notes,
+        lists and emails, which are fetched concurrently.  Returns
+        {page id: exception} for pages that couldn't be fetched."""
+        pages=[record for kind, record in self.bp.export.iterExport()
+            if kind == 'page']
+        results=self.bp.batch([(self._fetchPage, p.id) for p in pages])
+
+        failed={}
+        self.lock.acquire()
+        try:
+            self.__clear()
+            for page, f in zip(pages, results):
+                self.__page(page.id, page.title, page.description)
+                if f.exception() is not None:
+                    failed[page.id]=f.exception()
+                    continue
+                self.__contents(page.id, f.value)
+        finally:
+            self.lock.release()
+        return failed
+
+    # Index what _fetchPage() got.  Must be called with the lock held.
+    def __contents(self, pageId, contents):
+        notes, lists, emails=contents
+        for n in notes:
+            self.__note(pageId, n.id, n.title, n.text)
+        for listId, items in lists:
+            for i in items:
+                self.__item(pageId, listId, i.id, i.text)
+        for e in emails:
+            self.__email(pageId, e.id, e.subject, e.text)
+
+    def refresh(self):
+        """Fetch and index the contents of pages the client changed in ways
+        a listener can't see, such as duplicated pages.  search() does this
+        first.  Returns {page id: exception} for pages that couldn't be
+        fetched; they're tried again next time."""
+        self.lock.acquire()
+        try:
+            pageIds=list(self.stalePages)
+        finally:
+            self.lock.release()
+        if not pageIds:
+            return {}
+        results=self.bp.batch([(self._fetchPage, id) for id in pageIds])
+
+        failed={}
+        self.lock.acquire()
+        try:
+            for pageId, f in zip(pageIds, results):
+                if pageId not in self.stalePages:
+                    # Destroyed meanwhile
+                    continue
+                if f.exception() is not None:
+                    failed[pageId]=f.exception()
+                    continue
+                self.stalePages.discard(pageId)
+                self.__removeWhere(lambda doc:
+                    doc[1] == pageId and doc[0] != 'page')
+                self.__contents(pageId, f.value)
+        finally:
+            self.lock.release()
+        return failed
+
+    def _changed(self, change):
+        api, method, args, result=change.api, change.method, change.args, \
+            change.result
+        self.lock.acquire()
+        try:
+            if api == 'page':
+                if method == 'create':
+                    self.__page(result.id, result.title, u'')
+                elif method == 'duplicate':
+                    # The server copies the contents too
+                    self.__page(result.id, result.title,
+                        self.descriptions.get(args[0], u''))
+                    self.stalePages.add(result.id)
+                elif method == 'updateTitle':
+                    self.__page(args[0], args[1])
+                elif method == 'destroy':
+                    self.titles.pop(args[0], None)
+                    self.descriptions.pop(args[0], None)
+                    self.stalePages.discard(args[0])
+                    self.__removeWhere(lambda doc: doc[1] == args[0])
+            elif api == 'notes':
+                if method == 'create':
+                    self.__note(args[0], result.id, result.title,
+                        result.text)
+                elif method == 'update':
+                    self.__note(*args)
+                elif method == 'destroy':
+                    self.__remove(('note', args[1]))
+            elif api == 'listItem':
+                if method == 'create':
+                    self.__item(args[0], args[1], result.id, result.text)
+                elif method == 'update':
+                    self.__item(*args)
+                elif method == 'destroy':
+                    self.__remove(('item', args[2]))
+            elif api == 'list' and method == 'destroy':
+                self.__removeWhere(lambda doc:
+                    doc[0] == 'list' and doc[2] == args[1])
+            elif api == 'email' and method == 'destroy':
+                self.__remove(('email', args[1]))
+        finally:
+            self.lock.release()
+
+    # Searching
+
+    def snippet(self, text, words):
+        """Get the part of text around the first of the given words."""
+        size=self.snippetSize
+        lower=text.lower()
+        first=None
+        for m in _WORD.finditer(lower):
+            if m.group(0) in words:
+                first=m.start()
+                break
+        if first is None:
+            first=0
+        start=max(0, first - size / 4)
+        # Don't start or end in the middle of a word
+        while start > 0 and text[start - 1].isalnum():
+            start -= 1
+        end=min(len(text), start + size)
+        while end < len(text) and text[end].isalnum():
+            end += 1
+        rv=u' '.join(text[start:end].split())
+        if start > 0:
+            rv=u'...' + rv
+        if end < len(text):
+            rv += u'...'
+        return rv
+
+    def search(self, query, limit=None):
+        """Get SearchResults for the containers with documents containing
+        every word of the query, best first.  Pages waiting for refresh()
+        are fetched first."""
+        words=tokenize(query)
+        if not words:
+            return []
+        if self.stalePages:
+            self.refresh()
+        self.lock.acquire()
+        try:
+            n=float(len(self.documents))
+            postings=[self.postings.get(w, {}) for w in words]
+            postings.sort(key=len)
+            # container -> (total score, best score, best document key)
+            best={}
+            for key in postings[0]:
+                if not all([key in p for p in postings[1:]]):
+                    continue
+                score=0
+                for p in postings:
+                    score += (1 + math.log(p[key])) * math.log(1 + n / len(p))
+                container=self.documents[key][:3]
+                total, bestScore, bestKey=best.get(container, (0, -1, None))
+                if score > bestScore:
+                    bestScore, bestKey=score, key
+                best[container]=(total + score, bestScore, bestKey)
+            ranked=[(total, container, key)
+                for container, (total, score, key) in best.items()]
+            ranked.sort(key=lambda r: (-r[0], r[1]))
+            if limit is not None:
+                ranked=ranked[:limit]
+
+            rv=[]
+            wanted=dict([(w, 1) for w in words])
+            for score, (type, pageId, containerId), key in ranked:
+                sr=backpack.SearchResult()
+                sr.bp=self.bp
+                sr.pageId=pageId
+                sr.pageTitle=self.titles.get(pageId, u'')
+                sr.type=type
+                sr.containerId=containerId
+                sr.score=score
+                sr.snippet=self.snippet(self.documents[key][3], wanted)
+                rv.append(sr)
+            return rv
+        finally:
+            self.lock.release()
+
+class TagIndex(object):
+    """Which pages have which tags.
+
+    Tags are referred to by id or name.  A tag's pages are refetched with
+    pagesForTag() once they're older than maxAge seconds, or after the
+    client tags or untags a page.  The stale tags a query needs and the
+    pages the client tagged are refetched together, in one batch.
+
+    * bp - the Backpack the tags come from, and whose changes are followed
+    * maxAge - seconds a tag's pages are trusted
+    """
+
+    def __init__(self, bp, maxAge=300):
+        self.bp=bp
+        self.maxAge=maxAge
+        self.lock=threading.Lock()
+        # tag id -> name
+        self.names={}
+        # lowercased name -> tag id
+        self.ids={}
+        # tag id -> set of page ids
+        self.pages={}
+        # tag id -> when its pages were last fetched, 0 if they're stale
+        self.fetched={}
+        # page id -> title
+        self.titles={}
+        # Pages tagged through the client since their tags were fetched
+        self.stalePages=set()
+        self.listening=True
+        bp.addListener(self._changed)
+
+    def close(self):
+        """Stop following the client's changes."""
+        if self.listening:
+            self.bp.removeListener(self._changed)
+            self.listening=False
+
+    # Must be called with the lock held
+    def __learnTag(self, tag):
+        if tag.id not in self.names:
+            self.pages[tag.id]=set()
+            self.fetched[tag.id]=0
+        self.names[tag.id]=tag.name
+        self.ids[tag.name.lower()]=tag.id
+
+    # Must be called with the lock held
+    def __addPage(self, page):
+        self.titles[page.id]=page.title
+        self.stalePages.discard(page.id)
+        for pages in self.pages.values():
+            pages.discard(page.id)
+        for tag in page.tags:
+            self.__learnTag(tag)
+            self.pages[tag.id].add(page.id)
+
+    def addPage(self, page):
+        """Learn the tags of a Page (from PageAPI.get())."""
+        self.lock.acquire()
+        try:
+            self.__addPage(page)
+        finally:
+            self.lock.release()
+
+    def build(self):
+        """Learn every page's tags with page.list() and a batch of
+        page.get().  Since every page was seen, all tags are fresh
+        afterwards.  Returns {page id: exception} for pages that couldn't
+        be fetched."""
+        start=time.time()
+        pageList=self.bp.page.list()
+        results=self.bp.batch([(self.bp.page.get, p.id) for p in pageList])
+        failed={}
+        self.lock.acquire()
+        try:
+            self.names={}
+            self.ids={}
+            self.pages={}
+            self.fetched={}
+            self.stalePages=set()
+            self.titles=dict([(p.id, p.title) for p in pageList])
+            for p, f in zip(pageList, results):
+                if f.exception() is None:
+                    self.__addPage(f.value)
+                else:
+                    failed[p.id]=f.exception()
+            if not failed:
+                for id in self.fetched:
+                    self.fetched[id]=start
+        finally:
+            self.lock.release()
+        return failed
+
+    def tagId(self, tag):
+        """Get the id of a tag given by id or name."""
+        if isinstance(tag, basestring):
+            try:
+                return self.ids[tag.lower()]
+            except KeyError:
+                raise KeyError("Unknown tag:  " + tag)
+        return tag
+
+    def stale(self, tags=None):
+        """Get the ids of the given tags (default all) that need
+        refreshing."""
+        self.lock.acquire()
+        try:
+            return self.__stale(tags)
+        finally:
+            self.lock.release()
+
+    # Must be called with the lock held
+    def __stale(self, tags):
+        oldest=time.time() - self.maxAge
+        if tags is None:
+            ids=self.fetched.keys()
+        else:
+            ids=[self.tagId(t) for t in tags]
+        return [id for id in ids if self.fetched.get(id, 0) < oldest]
+
+    def refresh(self, tags=None, force=False):
+        """Refetch the pages of the given tags (default all) that are stale,
+        or all of them with force, along with the pages the client tagged.
+        They're all fetched concurrently in one batch.  Returns {tag or
+        page id: exception} for those that couldn't be fetched.
+
+        A tag first seen on a page the client tagged gets the pages known
+        to have it, and stays stale until refreshed itself."""
+        self.lock.acquire()
+        try:
+            pageIds=list(self.stalePages)
+            if force:
+                ids=[self.tagId(t) for t in (tags or self.fetched.keys())]
+            else:
+                ids=self.__stale(tags)
+        finally:
+            self.lock.release()
+        if not pageIds and not ids:
+            return {}
+
+        start=time.time()
+        results=self.bp.batch([(self.bp.page.get, id) for id in pageIds]
+            + [(self.bp.tags.pagesForTag, id) for id in ids])
+        failed={}
+        self.lock.acquire()
+        try:
+            for id, f in zip(pageIds, results):
+                if id not in self.stalePages:
+                    # Destroyed meanwhile
+                    continue
+                if f.exception() is None:
+                    self.__addPage(f.value)
+                else:
+                    failed[id]=f.exception()
+            for id, f in zip(ids, results[len(pageIds):]):
+                if f.exception() is not None:
+                    failed[id]=f.exception()
+                    continue
+                self.pages[id]=set([p.id for p in f.value])
+                self.fetched[id]=start
+                self.names.setdefault(id, unicode(id))
+                for p in f.value:
+                    self.titles[p.id]=p.title
+        finally:
+            self.lock.release()
+        return failed
+
+    def _changed(self, change):
+        api, method, args=change.api, change.method, change.args
+        if api == 'tags' and method == 'tagPage':
+            pageId, names=args[0], args[1]
+            self.lock.acquire()
+            try:
+                # Tags the page had and tags it was given are stale, and the
+                # page is refetched to learn the ids of new tags
+                self.stalePages.add(pageId)
+                for id, pages in self.pages.items():
+                    if pageId in pages:
+                        self.fetched[id]=0
+                for name in names:
+                    id=self.ids.get(name.lower())
+                    if id is not None:
+                        self.fetched[id]=0
+            finally:
+                self.lock.release()
+        elif api == 'page' and method == 'destroy':
+            self.lock.acquire()
+            try:
+                self.titles.pop(args[0], None)
+                self.stalePages.discard(args[0])
+                for pages in self.pages.values():
+                    pages.discard(args[0])
+            finally:
+                self.lock.release()
+        elif api == 'page' and method == 'create':
+            self.lock.acquire()
+            try:
+                self.titles[change.result.id]=change.result.title
+            finally:
+                self.lock.release()
+        elif api == 'page' and method == 'updateTitle':
+            self.lock.acquire()
+            try:
+                self.titles[args[0]]=args[1]
+            finally:
+                self.lock.release()
+
+    def select(self, all=(), any=(), exclude=()):
+        """Get the ids of the pages with every tag in all, at least one tag
+        in any (if given) and none of the tags in exclude, sorted.
+
+        With neither all nor any, every known page not excluded is
+        selected.  Stale tags among them are refreshed first; a tag
+        nobody has is on no pages."""
+        self.refresh([t for t in list(all) + list(any) + list(exclude)
+            if self.__known(t)])
+        self.lock.acquire()
+        try:
+            rv=None
+            for tag in all:
+                pages=self.__pagesFor(tag)
+                if rv is None:
+                    rv=set(pages)
+                else:
+                    rv &= pages
+            if any:
+                union=set()
+                for tag in any:
+                    union |= self.__pagesFor(tag)
+                if rv is None:
+                    rv=union
+                else:
+                    rv &= union
+            if rv is None:
+                rv=set(self.titles.keys())
+            for tag in exclude:
+                rv -= self.__pagesFor(tag)
+            return sorted(rv)
+        finally:
+            self.lock.release()
+
+    def __known(self, tag):
+        return (not isinstance(tag, basestring)) or tag.lower() in self.ids
+
+    def __pagesFor(self, tag):
+        if not self.__known(tag):
+            return set()
+        return self.pages.get(self.tagId(tag), set())
+
+    def selectTitles(self, all=(), any=(), exclude=()):
+        """Like select(), but get PageTitles."""
+        return [backpack.PageTitle(id, self.titles.get(id, u''))
+            for id in self.select(all, any, exclude)]
@@ -0,0 +1,335 @@
+#!/usr/bin/env python
+"""
+A local replica of a Backpack account.
+
+The replica is seeded from the account export and then kept up to date by
+sync(), which only downloads the pages that are new or have notes newer
+than the ones it has.  Reads
+are answered locally through the same list()/get() interface the Backpack
+APIs have:
+
+    replica=bpreplica.Replica(bp)
+    replica.seed()
+    replica.sync()
+    for id, scope, title in replica.page.list():
+        print title, replica.notes.list(id)
+"""
+
+import copy
+import time
+import threading
+import cPickle
+
+import backpack
+
+class PageRecord(object):
+    """Everything the replica knows about one page."""
+
+    def __init__(self, id, title, scope=u'', emailAddress=u''):
+        self.id=id
+        self.title=title
+        self.scope=scope
+        self.emailAddress=emailAddress
+        self.description=u''
+        self.tags=[]
+        self.notes=[]
+        self.lists=[]
+        # list id -> items
+        self.items={}
+        self.emails=[]
+        # Items from the export, which doesn't say which list they're on
+        self.exportedItems=[]
+        # When the page was last checked, 0 if never
+        self.fetched=0
+        # When the items and emails were last downloaded, 0 if never
+        self.downloaded=0
+        # Newest created_at seen on the page's notes and emails
+        self.newest=0
+
+    def updateNewest(self):
+        """Recompute the created_at watermark, returning the old one."""
+        rv=self.newest
+        times=[n[2] for n in self.notes] + [e[2] for e in self.emails]
+        if times:
+            self.newest=max(times)
+        return rv
+
+class SyncResult(object):
+    """What a sync changed.
+
+    * added - ids of new pages
+    * removed - ids of pages that went away
+    * refreshed - ids of pages whose details were downloaded
+    * checked - ids of pages checked and found unchanged
+    * newer - ids of pages with notes or emails newer than before
+    * failed - page id -> exception for pages that couldn't be fetched
+    """
+
+    def __init__(self):
+        self.added=[]
+        self.removed=[]
+        self.refreshed=[]
+        self.checked=[]
+        self.newer=[]
+        self.failed={}
+
+    def __repr__(self):
+        return "<SyncResult added=%s removed=%s refreshed=%s failed=%s>" \
+            % (self.added, self.removed, self.refreshed, self.failed.keys())
+
+class _View(object):
+    """Base for the read-only API views of a replica."""
+
+    def __init__(self, replica):
+        self.replica=replica
+
+    def _page(self, pageId):
+        try:
+            return self.replica.pages[pageId]
+        except KeyError:
+            raise backpack.BackpackError(404, "Record not found")
+
+class _PageView(_View):
+
+    def list(self):
+        """List all pages as PageRef(id, scope, title)."""
+        pages=self.replica.pages
+        return [backpack.PageRef(id, pages[id].scope, pages[id].title)
+            for id in self.replica.order]
+
+    def get(self, id):
+        """Get a Page instance."""
+        r=self._page(id)
+        rv=backpack.Page()
+        rv.id=r.id
+        rv.title=r.title
+        rv.emailAddress=r.emailAddress
+        rv.notes=list(r.notes)
+        rv.lists=list(r.lists)
+        rv.tags=list(r.tags)
+        return rv
+
+class _ListView(_View):
+
+    def list(self, pageId):
+        """Get a list of (id, name) lists on the given page."""
+        return list(self._page(pageId).lists)
+
+class _ListItemView(_View):
+
+    def list(self, pageId, listId):
+        """Get the (id, completedBoolean, text) items on the given list."""
+        try:
+            return list(self._page(pageId).items[listId])
+        except KeyError:
+            raise backpack.BackpackError(404, "Record not found")
+
+class _NoteView(_View):
+
+    def list(self, pageId):
+        """Get the (id, title, timestamp, text) notes on the given page."""
+        return list(self._page(pageId).notes)
+
+class _EmailView(_View):
+
+    def list(self, pageId):
+        """Get the (id, subject, timestamp, text) emails on the given page."""
+        return list(self._page(pageId).emails)
+
+    def get(self, pageId, mailId):
+        """Get an individual (id, subject, timestamp, text) email."""
+        for e in self._page(pageId).emails:
+            if e[0] == mailId:
+                return e
+        raise backpack.BackpackError(404, "Record not found")
+
+class _ReminderView(_View):
+
+    def list(self):
+        """Get a list of (timestamp, id, message) reminders."""
+        return list(self.replica.reminders)
+
+class Replica(object):
+    """A local copy of a Backpack account.
+
+    * page, list, listItem, notes, email, reminder - read-only views with
+      the same list()/get() methods as the Backpack APIs
+    * maxAge - seconds before a page is checked for changes
+    * fullAge - seconds before a page's details are downloaded even if no
+      newer notes were seen, since item edits and new emails don't show
+      up in a check
+    """
+
+    def __init__(self, bp, maxAge=300, fullAge=3600):
+        self.bp=bp
+        self.maxAge=maxAge
+        self.fullAge=fullAge
+        # page id -> PageRecord
+        self.pages={}
+        # page ids in the order the server lists them
+        self.order=[]
+        self.reminders=[]
+        self.lastSync=0
+        self.lock=threading.Lock()
+        self.__makeViews()
+
+    def __makeViews(self):
+        self.page=_PageView(self)
+        self.list=_ListView(self)
+        self.listItem=_ListItemView(self)
+        self.notes=_NoteView(self)
+        self.email=_EmailView(self)
+        self.reminder=_ReminderView(self)
+
+    def seed(self):
+        """Load pages and reminders from the account export.
+
+        The export has the pages' items, but not which list they're on,
+        nor the notes or emails; the next sync() fetches those.  Items
+        of a page with a single list are taken from the export rather
+        than fetched again."""
+        pages={}
+        order=[]
+        reminders=[]
+        for kind, record in self.bp.export.iterExport():
+            if kind == 'page':
+                id, title, emailAddress, description, items=record
+                p=PageRecord(id, title, emailAddress=emailAddress)
+                p.description=description
+                p.exportedItems=items
+                pages[id]=p
+                order.append(id)
+            else:
+                reminders.append(record)
+        self.lock.acquire()
+        try:
+            self.pages=pages
+            self.order=order
+            self.reminders=reminders
+        finally:
+            self.lock.release()
+
+    def _fetchPage(self, record, full=True):
+        """Fetch a page's details into a new PageRecord.
+
+        The page itself is always fetched.  Unless full, the items and
+        emails are only downloaded if the page's lists changed or it has a
+        note created after record's created_at watermark, and are otherwise
+        kept from record.  Returns (the new record, True if downloaded)."""
+        bp=self.bp
+        page=bp.page.get(record.id)
+        rv=PageRecord(record.id, record.title, record.scope,
+            page.emailAddress)
+        rv.description=record.description
+        rv.newest=record.newest
+        rv.downloaded=record.downloaded
+        rv.tags=page.tags
+        rv.notes=page.notes
+        rv.lists=page.lists
+        newer=[n for n in page.notes if n.createdAt > record.newest]
+        full=full or newer or list(page.lists) != list(record.lists)
+        if full:
+            if len(page.lists) == 1 and record.exportedItems \
+                and not record.downloaded:
+                rv.items[page.lists[0].id]=list(record.exportedItems)
+            else:
+                for listId, name in page.lists:
+                    rv.items[listId]=bp.listItem.list(record.id, listId)
+            rv.emails=bp.email.list(record.id)
+            rv.downloaded=time.time()
+        else:
+            rv.items=record.items
+            rv.emails=record.emails
+        rv.fetched=time.time()
+        return rv, bool(full)
+
+    def sync(self, force=False):
+        """Bring the replica up to date.
+
+        The page list and reminders are always fetched, and renamed pages
+        get their new titles.  Pages not checked in maxAge seconds are
+        fetched, and their items and emails are downloaded again only if
+        they have notes created since the last download, their lists
+        changed, or the last download is older than fullAge.  New pages
+        (or all of them, with force) are downloaded in full.  Pages are
+        fetched concurrently with Backpack.batch().  Returns a SyncResult.
+        """
+        rv=SyncResult()
+        pageList=self.bp.page.list()
+        reminders=self.bp.reminder.list()
+
+        self.lock.acquire()
+        try:
+            current=dict(self.pages)
+            currentOrder=list(self.order)
+        finally:
+            self.lock.release()
+
+        now=time.time()
+        pages={}
+        order=[]
+        # (record, full)
+        stale=[]
+        for id, scope, title in pageList:
+            old=current.get(id)
+            if old is None:
+                rv.added.append(id)
+                record=PageRecord(id, title, scope)
+            elif old.title != title or old.scope != scope:
+                # The live record is only replaced, never changed
+                record=copy.copy(old)
+                record.title=title
+                record.scope=scope
+            else:
+                record=old
+            order.append(id)
+            pages[id]=record
+            if force or old is None or not record.downloaded \
+                or record.downloaded + self.fullAge < now:
+                stale.append((record, True))
+            elif record.fetched + self.maxAge < now:
+                stale.append((record, False))
+        rv.removed=[id for id in currentOrder if id not in pages]
+
+        results=self.bp.batch([(self._fetchPage, r, full)
+            for r, full in stale])
+        for (record, full), f in zip(stale, results):
+            if f.exception() is not None:
+                rv.failed[record.id]=f.exception()
+                continue
+            fresh, downloaded=f.value
+            pages[record.id]=fresh
+            if downloaded:
+                rv.refreshed.append(record.id)
+            else:
+                rv.checked.append(record.id)
+            if fresh.updateNewest() < fresh.newest:
+                rv.newer.append(record.id)
+
+        self.lock.acquire()
+        try:
+            self.pages=pages
+            self.order=order
+            self.reminders=reminders
+            self.lastSync=now
+        finally:
+            self.lock.release()
+        return rv
+
+    def save(self, path):
+        """Save the replica's data to a file."""
+        f=open(path, "wb")
+        try:
+            cPickle.dump((self.pages, self.order, self.reminders,
+                self.lastSync), f, cPickle.HIGHEST_PROTOCOL)
+        finally:
+            f.close()
+
+    def load(self, path):
+        """Load data previously saved with save()."""
+        f=open(path, "rb")
+        try:
+            self.pages, self.order, self.reminders, self.lastSync= \
+                cPickle.load(f)
+        finally:
+            f.close()
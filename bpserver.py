@@ -0,0 +1,776 @@
+#!/usr/bin/env python
+"""
+A stand-in Backpack server for testing the client over real HTTP.
+
+It implements the /ws/... endpoints the backpack module uses against an
+in-memory account, and can inject latency, errors and throughput limits:
+
+    server=bpserver.FakeBackpack(token="k")
+    pageId=server.addPage("Groceries")
+    url=server.start()
+    bp=backpack.Backpack(url, "k")
+    ...
+    server.stop()
+
+Run it directly to serve a small account on a fixed port for load tests.
+"""
+
+import re
+import sys
+import time
+import zlib
+import shlex
+import random
+import threading
+import SocketServer
+from hashlib import md5
+import BaseHTTPServer
+import xml.dom.minidom
+from xml.sax.saxutils import escape, quoteattr
+
+import backpack
+
+def _utf8(s):
+    if isinstance(s, unicode):
+        return s.encode("utf-8")
+    return s
+
+class _Page(object):
+    def __init__(self, id, title, scope):
+        self.id=id
+        self.title=title
+        self.scope=scope
+        self.emailAddress="page%d@fake.backpackit.com" % (id,)
+        self.description=u''
+        self.lists=[]
+        self.notes=[]
+        self.emails=[]
+        self.tags=[]
+        self.public=False
+
+class _List(object):
+    def __init__(self, id, name):
+        self.id=id
+        self.name=name
+        self.items=[]
+
+class _Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads=True
+    allow_reuse_address=True
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version="HTTP/1.1"
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.server.fake._connected()
+
+    def do_POST(self):
+        length=int(self.headers.getheader('content-length', 0))
+        body=self.rfile.read(length)
+        fake=self.server.fake
+        if self.headers.getheader('content-encoding') == 'gzip':
+            body=zlib.decompress(body, 16 + zlib.MAX_WBITS)
+            fake._count('compressedRequests')
+        path=self.path
+        if '://' in path.split('?')[0]:
+            # Sent through a proxy; act as both
+            path='/' + path.split('://', 1)[1].split('/', 1)[-1]
+            fake._count('proxied')
+        status, data=fake._handle(path, body)
+        etag=None
+        if fake.etags and status == 200:
+            etag='"%s"' % (md5(data).hexdigest(),)
+            if self.headers.getheader('if-none-match') == etag:
+                status, data=304, ''
+                fake._count('notModified')
+        accept=self.headers.getheader('accept-encoding', '')
+        encoding=None
+        if fake.compress and data and 'gzip' in accept:
+            encoding='gzip'
+            c=zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            data=c.compress(data) + c.flush()
+            fake._count('compressedResponses')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/xml")
+        if encoding is not None:
+            self.send_header("Content-Encoding", encoding)
+        if etag is not None:
+            self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET=do_POST
+
+    def log_message(self, *args):
+        if self.server.fake.verbose:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, *args)
+
+class NotFound(Exception):
+    """Raised by handlers for records that don't exist."""
+
+class FakeBackpack(object):
+    """An in-memory Backpack account served over HTTP.
+
+    * token - the API token requests must carry
+    * latency - seconds each request is delayed
+    * maxPages - pages/new fails with a 403 beyond this many pages
+    * maxRate - most requests handled per second; extra requests wait
+      (or are rejected with a 503 if rejectOverRate is set)
+    * errorRate - fraction of requests that fail with a 500
+    * compress - gzip responses for clients that accept it
+    * etags - send ETags, and answer requests that have a matching
+      If-None-Match with a 304
+
+    Counters:  requests, connections, maxConcurrent, compressedRequests,
+    compressedResponses, notModified and proxied (requests sent to it as a
+    proxy, with the whole URL).
+    """
+
+    def __init__(self, token="token", latency=0, maxPages=None, maxRate=None,
+        rejectOverRate=False, errorRate=0, verbose=False, compress=False,
+        etags=False):
+        self.token=token
+        self.latency=latency
+        self.maxPages=maxPages
+        self.maxRate=maxRate
+        self.rejectOverRate=rejectOverRate
+        self.errorRate=errorRate
+        self.verbose=verbose
+        self.compress=compress
+        self.etags=etags
+
+        self.pages={}
+        self.order=[]
+        self.lists={}
+        self.items={}
+        self.notes={}
+        self.emails={}
+        self.reminders={}
+        self.tags={}
+
+        self.requests=0
+        self.connections=0
+        self.concurrent=0
+        self.maxConcurrent=0
+        self.compressedRequests=0
+        self.compressedResponses=0
+        self.notModified=0
+        self.proxied=0
+        self.paths=[]
+        # [path regex, status, remaining count]
+        self.faults=[]
+
+        self.lock=threading.RLock()
+        self.__nextId=1000
+        self.__nextSlot=0
+        self.server=None
+        self.thread=None
+
+    # Account setup
+
+    def _newId(self):
+        self.lock.acquire()
+        try:
+            self.__nextId += 1
+            return self.__nextId
+        finally:
+            self.lock.release()
+
+    def addPage(self, title, scope="personal", description=u''):
+        """Add a page, returning its id."""
+        p=_Page(self._newId(), _utf8(title), scope)
+        p.description=_utf8(description)
+        self.pages[p.id]=p
+        self.order.append(p.id)
+        return p.id
+
+    def addList(self, pageId, name):
+        """Add a list to a page, returning its id."""
+        l=_List(self._newId(), _utf8(name))
+        self.lists[l.id]=l
+        self.pages[pageId].lists.append(l.id)
+        return l.id
+
+    def addItem(self, listId, text, completed=False):
+        """Add an item to a list, returning its id."""
+        id=self._newId()
+        self.items[id]=[_utf8(text), completed]
+        self.lists[listId].items.append(id)
+        return id
+
+    def addNote(self, pageId, title, body, createdAt=None):
+        """Add a note to a page, returning its id."""
+        id=self._newId()
+        self.notes[id]=[_utf8(title), self.__timestamp(createdAt),
+            _utf8(body)]
+        self.pages[pageId].notes.append(id)
+        return id
+
+    def addEmail(self, pageId, subject, body, createdAt=None):
+        """Add an email to a page, returning its id."""
+        id=self._newId()
+        self.emails[id]=(_utf8(subject), self.__timestamp(createdAt),
+            _utf8(body))
+        self.pages[pageId].emails.append(id)
+        return id
+
+    def addReminder(self, content, at=None):
+        """Add a reminder, returning its id."""
+        id=self._newId()
+        self.reminders[id]=[self.__timestamp(at), _utf8(content)]
+        return id
+
+    def tagPage(self, pageId, names):
+        """Tag a page with the given tag names."""
+        tags=[]
+        for name in names:
+            if name not in self.tags:
+                self.tags[name]=self._newId()
+            tags.append((self.tags[name], _utf8(name)))
+        self.pages[pageId].tags=tags
+
+    def __timestamp(self, t):
+        if t is None:
+            t=time.time()
+        if not isinstance(t, basestring):
+            t=backpack.formatTime(t)
+        return t
+
+    # Fault injection
+
+    def injectError(self, pathRegex, status=500, count=1):
+        """Fail the next count requests matching pathRegex with status.
+
+        A count of None fails every matching request."""
+        self.lock.acquire()
+        try:
+            self.faults.append([re.compile(pathRegex), status, count])
+        finally:
+            self.lock.release()
+
+    def clearErrors(self):
+        """Remove all injected errors."""
+        self.lock.acquire()
+        try:
+            self.faults=[]
+        finally:
+            self.lock.release()
+
+    def __fault(self, path):
+        self.lock.acquire()
+        try:
+            for fault in self.faults:
+                regex, status, count=fault
+                if regex.search(path):
+                    if count is not None:
+                        fault[2] -= 1
+                        if fault[2] <= 0:
+                            self.faults.remove(fault)
+                    return status
+        finally:
+            self.lock.release()
+        if self.errorRate and random.random() < self.errorRate:
+            return 500
+
+    # Returns False if the request should be rejected
+    def __throttle(self):
+        if not self.maxRate:
+            return True
+        self.lock.acquire()
+        try:
+            now=time.time()
+            slot=max(now, self.__nextSlot)
+            if slot > now and self.rejectOverRate:
+                return False
+            self.__nextSlot=slot + 1.0 / self.maxRate
+        finally:
+            self.lock.release()
+        if slot > now:
+            time.sleep(slot - now)
+        return True
+
+    # Serving
+
+    def start(self, port=0):
+        """Start serving in a background thread, returning the base URL."""
+        self.server=_Server(("127.0.0.1", port), _Handler)
+        self.server.fake=self
+        self.thread=threading.Thread(target=self.server.serve_forever,
+            name="fake-backpack", kwargs={'poll_interval': 0.05})
+        self.thread.setDaemon(True)
+        self.thread.start()
+        return "http://127.0.0.1:%d/" % (self.server.server_address[1],)
+
+    def stop(self):
+        """Stop serving."""
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def _connected(self):
+        self._count('connections')
+
+    def _count(self, counter):
+        self.lock.acquire()
+        try:
+            setattr(self, counter, getattr(self, counter) + 1)
+        finally:
+            self.lock.release()
+
+    def _handle(self, path, body):
+        """Handle a request, returning (HTTP status, response body)."""
+        self.lock.acquire()
+        try:
+            self.requests += 1
+            self.paths.append(path)
+            self.concurrent += 1
+            self.maxConcurrent=max(self.maxConcurrent, self.concurrent)
+        finally:
+            self.lock.release()
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            if not self.__throttle():
+                return 503, "Over rate limit"
+            status=self.__fault(path)
+            if status is not None:
+                return status, "Injected error"
+            return self.__dispatch(path, body)
+        finally:
+            self.lock.acquire()
+            try:
+                self.concurrent -= 1
+            finally:
+                self.lock.release()
+
+    def __dispatch(self, path, body):
+        try:
+            request=xml.dom.minidom.parseString(body)
+        except Exception:
+            return 400, "Bad request"
+        if self.__text(request, "token") != self.token:
+            return 200, self.__error(403, "Invalid token")
+        for regex, method in self.ROUTES:
+            m=re.match(regex + "$", path)
+            if m:
+                self.lock.acquire()
+                try:
+                    try:
+                        rv=getattr(self, method)(request,
+                            *[int(g) for g in m.groups()])
+                    except NotFound:
+                        return 200, self.__error(404, "Record not found")
+                finally:
+                    self.lock.release()
+                if isinstance(rv, tuple):
+                    return rv
+                return 200, rv
+        return 404, "No such endpoint"
+
+    # Request and response helpers
+
+    def __text(self, request, name, default=None):
+        els=request.getElementsByTagName(name)
+        if not els:
+            return default
+        return u''.join([n.data for n in els[0].childNodes
+            if n.nodeType == n.TEXT_NODE]).encode("utf-8")
+
+    def __error(self, code, msg):
+        return """<response success='false'><error code='%d'>%s</error>""" \
+            """</response>""" % (code, escape(msg))
+
+    def __ok(self, content=""):
+        return '<?xml version="1.0" encoding="UTF-8"?>' \
+            '<response success="true">%s</response>' % (content,)
+
+    def __attrs(self, **kwargs):
+        rv=[]
+        for k, v in kwargs.items():
+            if not isinstance(v, basestring):
+                v=str(v)
+            rv.append("%s=%s" % (k, quoteattr(_utf8(v))))
+        return ' '.join(rv)
+
+    def __get(self, d, id):
+        try:
+            return d[id]
+        except KeyError:
+            raise NotFound()
+
+    def __page(self, pageId):
+        return self.__get(self.pages, pageId)
+
+    def __list(self, pageId, listId):
+        if listId not in self.__page(pageId).lists:
+            raise NotFound()
+        return self.lists[listId]
+
+    # Rendering
+
+    def __reminderXml(self, id):
+        at, content=self.reminders[id]
+        return "<reminder %s>%s</reminder>" \
+            % (self.__attrs(remind_at=at, id=id), escape(content))
+
+    def __itemXml(self, id):
+        text, completed=self.items[id]
+        return "<item %s>%s</item>" % (self.__attrs(id=id,
+            completed=str(completed).lower()), escape(text))
+
+    def __noteXml(self, id):
+        title, createdAt, body=self.notes[id]
+        return "<note %s>%s</note>" % (self.__attrs(title=title, id=id,
+            created_at=createdAt), escape(body))
+
+    def __emailXml(self, id):
+        subject, createdAt, body=self.emails[id]
+        return "<email %s>%s</email>" % (self.__attrs(subject=subject, id=id,
+            created_at=createdAt), escape(body))
+
+    def __listXml(self, id):
+        return "<list %s/>" % (self.__attrs(id=id, name=self.lists[id].name),)
+
+    def __pageRefXml(self, p):
+        return "<page %s/>" % (self.__attrs(id=p.id, title=p.title),)
+
+    # Reminders
+
+    def _reminderList(self, request):
+        ids=self.reminders.keys()
+        ids.sort(lambda a, b: cmp(self.reminders[a][0], self.reminders[b][0]))
+        return self.__ok("<reminders>%s</reminders>"
+            % (''.join([self.__reminderXml(id) for id in ids]),))
+
+    def __reminderFields(self, request):
+        content=self.__text(request, "content", "")
+        at=self.__text(request, "remind_at")
+        if at is None:
+            m=re.match(r'^\+(\d+)(?::(\d+))?\s*(.*)$', content)
+            if m is None:
+                return None, content
+            if m.group(2) is None:
+                delta=int(m.group(1)) * 60
+            else:
+                delta=int(m.group(1)) * 3600 + int(m.group(2)) * 60
+            at=backpack.formatTime(time.time() + delta)
+            content=m.group(3)
+        return at, content
+
+    def _reminderCreate(self, request):
+        at, content=self.__reminderFields(request)
+        if at is None:
+            return self.__error(400, "No time given")
+        id=self.addReminder(content, at)
+        return self.__ok("<reminders>%s</reminders>"
+            % (self.__reminderXml(id),))
+
+    def _reminderUpdate(self, request, id):
+        r=self.__get(self.reminders, id)
+        at, content=self.__reminderFields(request)
+        if at is not None:
+            r[0]=at
+        r[1]=content
+        return self.__ok("<reminders>%s</reminders>"
+            % (self.__reminderXml(id),))
+
+    def _reminderDestroy(self, request, id):
+        self.__get(self.reminders, id)
+        del self.reminders[id]
+        return self.__ok()
+
+    # Pages
+
+    def _pageList(self, request):
+        return self.__ok("<pages>%s</pages>" % (''.join(
+            ["<page %s/>" % (self.__attrs(scope=self.pages[id].scope,
+                title=self.pages[id].title, id=id),)
+                for id in self.order]),))
+
+    def _pageGet(self, request, pageId):
+        p=self.__page(pageId)
+        return self.__ok("<page %s><notes>%s</notes><lists>%s</lists>"
+            "<tags>%s</tags></page>" % (
+            self.__attrs(title=p.title, id=p.id,
+                email_address=p.emailAddress),
+            ''.join([self.__noteXml(id) for id in p.notes]),
+            ''.join([self.__listXml(id) for id in p.lists]),
+            ''.join(["<tag %s/>" % (self.__attrs(name=name, id=id),)
+                for id, name in p.tags])))
+
+    def _pageNew(self, request):
+        if self.maxPages is not None and len(self.pages) >= self.maxPages:
+            return 403, "Page limit exceeded"
+        id=self.addPage(self.__text(request, "title", ""))
+        return self.__ok(self.__pageRefXml(self.pages[id]))
+
+    def _pageDestroy(self, request, pageId):
+        self.__page(pageId)
+        del self.pages[pageId]
+        self.order.remove(pageId)
+        return self.__ok()
+
+    def _pageSearch(self, request):
+        term=self.__text(request, "term", "").lower()
+        out=[]
+        for pageId in self.order:
+            p=self.pages[pageId]
+            sends=[]
+            for id in p.notes:
+                title, createdAt, body=self.notes[id]
+                if term in title.lower() or term in body.lower():
+                    sends.append((id, "note"))
+            for id in p.lists:
+                for itemId in self.lists[id].items:
+                    if term in self.items[itemId][0].lower():
+                        sends.append((id, "list"))
+                        break
+            for id in p.emails:
+                subject, createdAt, body=self.emails[id]
+                if term in subject.lower() or term in body.lower():
+                    sends.append((id, "email"))
+            if sends:
+                out.append("<page %s>%s</page>" % (
+                    self.__attrs(title=p.title, id=p.id),
+                    ''.join(["<send id='%d'>%s</send>" % s for s in sends])))
+        return self.__ok("<pages>%s</pages>" % (''.join(out),))
+
+    def _pageUpdateTitle(self, request, pageId):
+        self.__page(pageId).title=self.__text(request, "title", "")
+        return self.__ok()
+
+    def _pageDuplicate(self, request, pageId):
+        p=self.__page(pageId)
+        id=self.addPage(p.title, p.scope, p.description)
+        for listId in p.lists:
+            newList=self.addList(id, self.lists[listId].name)
+            for itemId in self.lists[listId].items:
+                self.addItem(newList, *self.items[itemId])
+        for noteId in p.notes:
+            title, createdAt, body=self.notes[noteId]
+            self.addNote(id, title, body, createdAt)
+        return self.__ok(self.__pageRefXml(self.pages[id]))
+
+    def _pageShare(self, request, pageId):
+        p=self.__page(pageId)
+        p.public=self.__text(request, "public", "0") == "1"
+        return self.__ok()
+
+    def _pageNoop(self, request, pageId):
+        self.__page(pageId)
+        return self.__ok()
+
+    def _export(self, request):
+        pages=[]
+        for pageId in self.order:
+            p=self.pages[pageId]
+            items=[]
+            for listId in p.lists:
+                items.extend([self.__itemXml(id)
+                    for id in self.lists[listId].items])
+            description=''
+            if p.description:
+                description="<description>%s</description>" \
+                    % (escape(p.description),)
+            pages.append("<page %s>%s<items>%s</items></page>" % (
+                self.__attrs(title=p.title, id=p.id,
+                    email_address=p.emailAddress),
+                description, ''.join(items)))
+        return '<?xml version="1.0" encoding="UTF-8"?>' \
+            '<backpack username="fake"><pages>%s</pages>' \
+            '<reminders>%s</reminders></backpack>' % (''.join(pages),
+            ''.join([self.__reminderXml(id) for id in self.reminders]))
+
+    # Lists
+
+    def _listAdd(self, request, pageId):
+        self.__page(pageId)
+        id=self.addList(pageId, self.__text(request, "name", ""))
+        return self.__ok(self.__listXml(id))
+
+    def _listUpdate(self, request, pageId, listId):
+        self.__list(pageId, listId).name=self.__text(request, "name", "")
+        return self.__ok()
+
+    def _listDestroy(self, request, pageId, listId):
+        self.__list(pageId, listId)
+        self.pages[pageId].lists.remove(listId)
+        del self.lists[listId]
+        return self.__ok()
+
+    def _listList(self, request, pageId):
+        return self.__ok("<lists>%s</lists>" % (''.join(
+            [self.__listXml(id) for id in self.__page(pageId).lists]),))
+
+    # List items
+
+    def _itemList(self, request, pageId, listId):
+        l=self.__list(pageId, listId)
+        return self.__ok("<items>%s</items>"
+            % (''.join([self.__itemXml(id) for id in l.items]),))
+
+    def _itemAdd(self, request, pageId, listId):
+        self.__list(pageId, listId)
+        id=self.addItem(listId, self.__text(request, "content", ""))
+        return self.__ok("<items>%s</items>" % (self.__itemXml(id),))
+
+    def __item(self, pageId, listId, id):
+        l=self.__list(pageId, listId)
+        if id not in l.items:
+            raise NotFound()
+        return l
+
+    def _itemUpdate(self, request, pageId, listId, id):
+        self.__item(pageId, listId, id)
+        self.items[id][0]=self.__text(request, "content", "")
+        return self.__ok()
+
+    def _itemToggle(self, request, pageId, listId, id):
+        self.__item(pageId, listId, id)
+        self.items[id][1]=not self.items[id][1]
+        return self.__ok()
+
+    def _itemDestroy(self, request, pageId, listId, id):
+        self.__item(pageId, listId, id).items.remove(id)
+        del self.items[id]
+        return self.__ok()
+
+    def _itemMove(self, request, pageId, listId, id):
+        items=self.__item(pageId, listId, id).items
+        direction=self.__text(request, "direction")
+        i=items.index(id)
+        items.remove(id)
+        if direction == backpack.ListItemAPI.MOVE_LOWER:
+            items.insert(min(i + 1, len(items)), id)
+        elif direction == backpack.ListItemAPI.MOVE_HIGHER:
+            items.insert(max(i - 1, 0), id)
+        elif direction == backpack.ListItemAPI.MOVE_TO_TOP:
+            items.insert(0, id)
+        elif direction == backpack.ListItemAPI.MOVE_TO_BOTTOM:
+            items.append(id)
+        else:
+            items.insert(i, id)
+            return self.__error(400, "Unknown direction")
+        return self.__ok()
+
+    # Notes
+
+    def _noteList(self, request, pageId):
+        return self.__ok("<notes>%s</notes>" % (''.join(
+            [self.__noteXml(id) for id in self.__page(pageId).notes]),))
+
+    def _noteCreate(self, request, pageId):
+        self.__page(pageId)
+        id=self.addNote(pageId, self.__text(request, "title", ""),
+            self.__text(request, "body", ""))
+        return self.__ok("<notes>%s</notes>" % (self.__noteXml(id),))
+
+    def _noteUpdate(self, request, pageId, id):
+        if id not in self.__page(pageId).notes:
+            raise NotFound()
+        self.notes[id][0]=self.__text(request, "title", "")
+        self.notes[id][2]=self.__text(request, "body", "")
+        return self.__ok()
+
+    def _noteDestroy(self, request, pageId, id):
+        if id not in self.__page(pageId).notes:
+            raise NotFound()
+        self.pages[pageId].notes.remove(id)
+        del self.notes[id]
+        return self.__ok()
+
+    # Emails
+
+    def _emailList(self, request, pageId):
+        return self.__ok("<emails>%s</emails>" % (''.join(
+            [self.__emailXml(id) for id in self.__page(pageId).emails]),))
+
+    def _emailShow(self, request, pageId, id):
+        if id not in self.__page(pageId).emails:
+            raise NotFound()
+        return self.__ok("<emails>%s</emails>" % (self.__emailXml(id),))
+
+    def _emailDestroy(self, request, pageId, id):
+        if id not in self.__page(pageId).emails:
+            raise NotFound()
+        self.pages[pageId].emails.remove(id)
+        del self.emails[id]
+        return self.__ok()
+
+    # Tags
+
+    def _tagSelect(self, request, tagId):
+        pages=[self.pages[id] for id in self.order
+            if tagId in [t[0] for t in self.pages[id].tags]]
+        return self.__ok("<pages>%s</pages>"
+            % (''.join([self.__pageRefXml(p) for p in pages]),))
+
+    def _tagPage(self, request, pageId):
+        self.__page(pageId)
+        self.tagPage(pageId, shlex.split(self.__text(request, "tags", "")))
+        return self.__ok()
+
+    ROUTES=[
+        (r"/ws/reminders", "_reminderList"),
+        (r"/ws/reminders/create", "_reminderCreate"),
+        (r"/ws/reminders/update/(\d+)", "_reminderUpdate"),
+        (r"/ws/reminders/destroy/(\d+)", "_reminderDestroy"),
+        (r"/ws/pages/all", "_pageList"),
+        (r"/ws/pages/new", "_pageNew"),
+        (r"/ws/pages/search", "_pageSearch"),
+        (r"/ws/page/(\d+)", "_pageGet"),
+        (r"/ws/page/(\d+)/destroy", "_pageDestroy"),
+        (r"/ws/page/(\d+)/update_title", "_pageUpdateTitle"),
+        (r"/ws/page/(\d+)/duplicate", "_pageDuplicate"),
+        (r"/ws/page/(\d+)/share", "_pageShare"),
+        (r"/ws/page/(\d+)/unshare_friend_page", "_pageNoop"),
+        (r"/ws/page/(\d+)/email", "_pageNoop"),
+        (r"/ws/account/export", "_export"),
+        (r"/ws/page/(\d+)/lists/add", "_listAdd"),
+        (r"/ws/page/(\d+)/lists/update/(\d+)", "_listUpdate"),
+        (r"/ws/page/(\d+)/lists/destroy/(\d+)", "_listDestroy"),
+        (r"/ws/page/(\d+)/lists/list", "_listList"),
+        (r"/ws/page/(\d+)/lists/(\d+)/items/list", "_itemList"),
+        (r"/ws/page/(\d+)/lists/(\d+)/items/add", "_itemAdd"),
+        (r"/ws/page/(\d+)/lists/(\d+)/items/update/(\d+)", "_itemUpdate"),
+        (r"/ws/page/(\d+)/lists/(\d+)/items/toggle/(\d+)", "_itemToggle"),
+        (r"/ws/page/(\d+)/lists/(\d+)/items/destroy/(\d+)", "_itemDestroy"),
+        (r"/ws/page/(\d+)/lists/(\d+)/items/move/(\d+)", "_itemMove"),
+        (r"/ws/page/(\d+)/notes/list", "_noteList"),
+        (r"/ws/page/(\d+)/notes/create", "_noteCreate"),
+        (r"/ws/page/(\d+)/notes/update/(\d+)", "_noteUpdate"),
+        (r"/ws/page/(\d+)/notes/destroy/(\d+)", "_noteDestroy"),
+        (r"/ws/page/(\d+)/emails/list", "_emailList"),
+        (r"/ws/page/(\d+)/emails/show/(\d+)", "_emailShow"),
+        (r"/ws/page/(\d+)/emails/destroy/(\d+)", "_emailDestroy"),
+        (r"/ws/tags/select/(\d+)", "_tagSelect"),
+        (r"/ws/page/(\d+)/tags/tag", "_tagPage"),
+    ]
+
+def sampleAccount(server, pages=10, items=20):
+    """Fill a server with some pages of lists, notes and reminders."""
+    for i in range(pages):
+        pageId=server.addPage("Page %d" % (i,))
+        listId=server.addList(pageId, "List %d" % (i,))
+        for j in range(items):
+            server.addItem(listId, "Item %d.%d" % (i, j), j % 3 == 0)
+        server.addNote(pageId, "Note %d" % (i,), "Notes for page %d" % (i,))
+        server.addEmail(pageId, "Email %d" % (i,), "Mail for page %d" % (i,))
+        server.tagPage(pageId, ["all", "tag%d" % (i % 3,)])
+        server.addReminder("Reminder %d" % (i,), time.time() + i * 3600)
+
+if __name__ == '__main__':
+    port=8080
+    if len(sys.argv) > 1:
+        port=int(sys.argv[1])
+    server=FakeBackpack()
+    sampleAccount(server)
+    print "Serving a fake account with token %r at %s" \
+        % (server.token, server.start(port))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
@@ -60,5 +60,7 @@ def doAdd(bp, fs):
     sendContent(wml(card("added", "Added Reminder",
         "Added a reminder for %s:  %s" % (time.ctime(ts), msg))))
 
+ACTIONS={"list": doList, "add": doAdd}
+
 if __name__ == '__main__':
-    doCallback({"list": doList, "add": doAdd})
+    doCallback(ACTIONS)
@@ -49,72 +49,150 @@ Modifying $n ($i)<br/>
 """ % {'rnd': random.Random().randint(0,10000)}
     return rv
 
+# Items shown per card, and the most characters of items a card may hold
+PAGE_SIZE=10
+MAX_CARD=1000
+
+def getOption(name, default):
+    if conf.has_option('backpack', name):
+        return conf.getint('backpack', name)
+    return default
+
 def getTodoId():
     return int(conf.get('backpack', 'todopage'))
 
-def makeList(bp, fs, wantAll=False):
-    # Get all of the todo entries
-    todo=bp.list.list(getTodoId())
-    # If we don't want all of them, limit the list to only incomplete items
-    if not wantAll:
-        todo=[x for x in todo if not x[1]]
-    out="Found %d todos:<br/>" % (len(todo))
-    for id, complete, text in todo:
-        if complete:
-            mark="x"
-        else:
-            mark="*"
-        out += '\n%s <anchor>%s<go href="#m">\n' \
-            '  <setvar name="i" value="%d"/>\n' \
-            '  <setvar name="n" value="%s"/></go></anchor><br/>\n' \
-            % (mark, text, id, text)
-    out+='<br/><a href="#new">Add a todo</a>'
-    if not wantAll:
-        out+='<br/><a href="/cgi-bin/bp/todo.py?action=listAll">Display All</a>'
-
-    sendContent(wml(card("todo", "Todo list", out)
+def getTodoListId(bp):
+    """Get the id of the todo list:  the todolist option, or the first list
+    on the todo page."""
+    if conf.has_option('backpack', 'todolist'):
+        return int(conf.get('backpack', 'todolist'))
+    return bp.list.list(getTodoId())[0].id
+
+# The actions showing the list, and their link labels
+LIST_ACTIONS=[('list', 'Display Open'), ('listAll', 'Display All'),
+    ('listDone', 'Display Done')]
+
+def itemMarkup(item):
+    if item.completed:
+        mark="x"
+    else:
+        mark="*"
+    return '\n%s <anchor>%s<go href="#m">\n' \
+        '  <setvar name="i" value="%d"/>\n' \
+        '  <setvar name="n" value="%s"/></go></anchor><br/>\n' \
+        % (mark, text(item.text), item.id, text(item.text))
+
+def listLink(action, label, start=None):
+    if start is None:
+        return '<br/><a href="/cgi-bin/bp/todo.py?action=%s">%s</a>' \
+            % (action, label)
+    return '<br/><a href="/cgi-bin/bp/todo.py?action=%s&amp;s=%d">%s</a>' \
+        % (action, start, label)
+
+def cardItems(todo, start, pageSize, room):
+    """Get how many of the todos from start go on a card with room
+    characters for them.  A card always gets at least one."""
+    shown=0
+    size=0
+    for item in todo[start:start + pageSize]:
+        size += len(itemMarkup(item))
+        if shown and size > room:
+            break
+        shown += 1
+    return shown
+
+def previousStart(todo, start, pageSize, room):
+    """Get where the card before the one at start begins:  the earliest
+    start whose card still reaches the one at start."""
+    rv=max(0, min(start, len(todo)) - 1)
+    while rv > 0 and rv - 1 + cardItems(todo, rv - 1, pageSize, room) \
+        >= start:
+        rv -= 1
+    return rv
+
+def makeList(bp, fs, action, wanted):
+    """Show the todos for which wanted(item) is true, a card at a time.
+
+    Each card starts at the item given by the s field and holds up to
+    pagesize items, or fewer if they and the links would go over cardsize
+    characters."""
+    pageSize=getOption('pagesize', PAGE_SIZE)
+    start=max(0, int(fs.getvalue("s", 0)))
+    todo=[item for item in bp.listItem.list(getTodoId(), getTodoListId(bp))
+        if wanted(item)]
+
+    others=['<br/><a href="#new">Add a todo</a>']
+    others.extend([listLink(other, label) for other, label in LIST_ACTIONS
+        if other != action])
+    # Leave room for the longest Previous and Next links there could be
+    longest=len(listLink(action, 'Previous', len(todo))) \
+        + len(listLink(action, 'Next', len(todo)))
+
+    c=CardWriter("todo", "Todo list", getOption('cardsize', MAX_CARD))
+    c.add("Found %d todos:<br/>" % (len(todo)))
+    room=c.room() - longest - len(''.join(others))
+    shown=cardItems(todo, start, pageSize, room)
+    for item in todo[start:start + shown]:
+        c.add(itemMarkup(item))
+
+    if start > 0:
+        c.add(listLink(action, 'Previous',
+            previousStart(todo, start, pageSize, room)))
+    if start + shown < len(todo):
+        c.add(listLink(action, 'Next', start + shown))
+    for s in others:
+        c.add(s)
+
+    sendContent(wml(c.render()
         + card("new", "New Todo", getNewForm())
         + card("m", "Modify Todo", getModifyForm())))
 
 def doList(bp, fs):
-    makeList(bp, fs, False)
+    makeList(bp, fs, "list", lambda item: not item.completed)
 
 def doListAll(bp, fs):
-    makeList(bp, fs, True)
+    makeList(bp, fs, "listAll", lambda item: True)
+
+def doListDone(bp, fs):
+    makeList(bp, fs, "listDone", lambda item: item.completed)
 
 def doAdd(bp, fs):
     what=fs["w"].value
 
-    id, complete, text=bp.list.create(getTodoId(), what)
+    id, complete, t=bp.listItem.create(getTodoId(), getTodoListId(bp), what)
     sendContent(wml(card("added", "Added Todo",
-        "Added a todo item with ID %d:  %s" % (id, text))))
+        "Added a todo item with ID %d:  %s" % (id, text(t)))))
 
 def modify(bp, fs):
     id=int(fs["i"].value)
     action=fs["a"].value
 
+    items=bp.listItem
+    move=lambda direction: lambda a, b, c: items.move(a, b, c, direction)
     actions={
-        "check": (bp.list.toggle,
+        "check": (items.toggle,
             "Toggled", "Your todo entry has been marked done."),
-        "delete": (bp.list.destroy,
+        "delete": (items.destroy,
             "Deleted", "Your todo entry has been deleted."),
-        'mtop': (lambda a, b: bp.list.move(a, b, backpack.ListAPI.MOVE_TO_TOP),
+        'mtop': (move(backpack.ListItemAPI.MOVE_TO_TOP),
             "Moved", "Your todo entry has been moved to the top."),
-        'mup': (lambda a, b: bp.list.move(a, b, backpack.ListAPI.MOVE_HIGHER),
+        'mup': (move(backpack.ListItemAPI.MOVE_HIGHER),
             "Moved", "Your todo entry has been moved up."),
-        'mbottom': (lambda a, b:
-                bp.list.move(a, b, backpack.ListAPI.MOVE_TO_BOTTOM),
+        'mbottom': (move(backpack.ListItemAPI.MOVE_TO_BOTTOM),
             "Moved", "Your todo entry has moved to the bottom."),
-        'mdown': (lambda a, b: bp.list.move(a, b, backpack.ListAPI.MOVE_LOWER),
+        'mdown': (move(backpack.ListItemAPI.MOVE_LOWER),
             "Moved", "Your todo entry has moved lower."),
     }
 
-    actions[action][0](getTodoId(), id)
+    actions[action][0](getTodoId(), getTodoListId(bp), id)
     sendContent(wml(card("modified", actions[action][1], actions[action][2])))
 
+ACTIONS={
+    "list": doList,
+    "listAll": doListAll,
+    "listDone": doListDone,
+    "add": doAdd,
+    "modify": modify}
+
 if __name__ == '__main__':
-    doCallback({
-        "list": doList,
-        "listAll": doListAll,
-        "add": doAdd,
-        "modify": modify})
+    doCallback(ACTIONS)
@@ -0,0 +1,66 @@
+#!/usr/bin/env /usr/local/bin/python
+"""
+The todo and reminder WAP frontends as one long-running WSGI application.
+
+The config, Backpack client, connection pool and cache are set up once
+and reused by every request, instead of once per CGI hit.  Mount it where
+the CGIs were, so the links they generate keep working:
+
+    /cgi-bin/bp/todo.py?action=list
+    /cgi-bin/bp/reminder.py?action=add
+
+Run it directly to serve it over FastCGI (with flup) or, with a port, over
+HTTP for testing:
+
+    python wapapp.py --fcgi
+    python wapapp.py 8080
+
+Copyright (c) 2005  Dustin Sallings <dustin@spy.net>
+"""
+
+import sys
+import cgi
+
+import wapsupport
+import todo
+import reminder
+
+# Script name -> actions
+SCRIPTS={'todo.py': todo.ACTIONS, 'reminder.py': reminder.ACTIONS}
+
+def application(environ, start_response):
+    """The WSGI application."""
+    script=environ.get('PATH_INFO', '').split('/')[-1]
+    funcs=SCRIPTS.get(script)
+    if funcs is None:
+        start_response('404 Not Found', [('Content-Type', 'text/plain')])
+        return ['No such page\n']
+
+    fs=cgi.FieldStorage(fp=environ['wsgi.input'], environ=environ)
+    out=[]
+    wapsupport.capture(lambda contentType, data:
+        out.append((contentType, data)))
+    try:
+        wapsupport.runAction(funcs, fs)
+    finally:
+        wapsupport.capture(None)
+
+    contentType, data=out[-1]
+    start_response('200 OK', [('Content-Type', contentType),
+        ('Content-Length', str(len(data))),
+        ('Cache-Control', 'no-cache')])
+    return [data]
+
+def main(args):
+    if args == ['--fcgi']:
+        from flup.server.fcgi import WSGIServer
+        WSGIServer(application).run()
+    elif len(args) == 1:
+        from wsgiref.simple_server import make_server
+        make_server('', int(args[0]), application).serve_forever()
+    else:
+        sys.stderr.write("Usage:  %s --fcgi|port\n" % (sys.argv[0],))
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -7,7 +7,9 @@ Copyright (c) 2005  Dustin Sallings <dustin@spy.net>
 
 import sys
 import cgi
+import threading
 import ConfigParser
+from xml.sax.saxutils import escape
 
 import backpack
 
@@ -22,10 +24,26 @@ HEADER="""<?xml version="1.0"?>
   "-//WAPFORUM//DTD WML 1.1//EN" "http://www.wapforum.org/DTD/wml_1.1.xml">
 """
 
+CONTENT_TYPE="text/vnd.wap.wml"
+
+# Where the current thread's output goes; see capture()
+_output=threading.local()
+
+def capture(send):
+    """Send this thread's content to send(contentType, data) instead of
+    stdout, or back to stdout if send is None."""
+    _output.send=send
+
 def sendContent(data):
     """Send the content as wml"""
-    sys.stdout.write("Content-type: text/vnd.wap.wml\n")
     toSend=HEADER + data
+    if isinstance(toSend, unicode):
+        toSend=toSend.encode("utf-8")
+    send=getattr(_output, 'send', None)
+    if send is not None:
+        send(CONTENT_TYPE, toSend)
+        return
+    sys.stdout.write("Content-type: %s\n" % (CONTENT_TYPE,))
     sys.stdout.write("Content-length: %d\n\n" % len(toSend))
     sys.stdout.write(toSend)
 
@@ -38,6 +56,34 @@ def card(id, title, s):
     return """<card id="%(id)s" title="%(title)s"><p>%(s)s</p></card>""" % \
         {'id': id, 'title': title, 's': s}
 
+def text(s):
+    """Escape text for use in WML content or attributes."""
+    return escape(s, {'"': '&quot;', '$': '$$'})
+
+class CardWriter(object):
+    """Builds a card's content a piece at a time.
+
+    The pieces are joined once when the card is rendered.  maxSize is the
+    most characters of content the card should hold; room() tells how many
+    are left."""
+
+    def __init__(self, id, title, maxSize):
+        self.id=id
+        self.title=title
+        self.maxSize=maxSize
+        self.parts=[]
+        self.size=0
+
+    def room(self):
+        return self.maxSize - self.size
+
+    def add(self, s):
+        self.parts.append(s)
+        self.size += len(s)
+
+    def render(self):
+        return card(self.id, self.title, ''.join(self.parts))
+
 def handleException(tvt):
     """Print out any exception that may occur."""
     type, value, tb = tvt
@@ -45,15 +91,44 @@ def handleException(tvt):
     sendContent(wml(card("error", "Error",
         "<b>Got an error:</b><br/>  %s" % (value,))))
 
-def doCallback(funcs):
-    """Execute the action."""
-    fs=cgi.FieldStorage()
-    bp=backpack.Backpack(conf.get("backpack", "url"),
-        conf.get("backpack", "key"))
+def getCache():
+    """Get the on-disk response cache named by the cache option, if any.
+
+    It's shared by every run, so a fresh process can answer reads without
+    asking the server."""
+    if not conf.has_option("backpack", "cache"):
+        return None
+    ttl=30
+    if conf.has_option("backpack", "cachettl"):
+        ttl=conf.getfloat("backpack", "cachettl")
+    return backpack.DiskCache(conf.get("backpack", "cache"), ttl=ttl)
 
-    action=funcs[fs.getvalue("action", "list")]
+_bp=None
+_bpLock=threading.Lock()
 
+def getBackpack():
+    """Get the Backpack client for the configured account.
+
+    It's built once per process, so a long-running server keeps its
+    connections and cache between requests."""
+    global _bp
+    _bpLock.acquire()
     try:
-        action(bp, fs)
+        if _bp is None:
+            _bp=backpack.Backpack(conf.get("backpack", "url"),
+                conf.get("backpack", "key"), cache=getCache())
+        return _bp
+    finally:
+        _bpLock.release()
+
+def runAction(funcs, fs):
+    """Run the action named by the request's fields."""
+    try:
+        action=funcs[fs.getvalue("action", "list")]
+        action(getBackpack(), fs)
     except:
         handleException(sys.exc_info())
+
+def doCallback(funcs):
+    """Execute the action."""
+    runAction(funcs, cgi.FieldStorage())